@@ -0,0 +1,56 @@
+import argparse
+import contextlib
+import io
+import time
+
+from TableProcessor import TableProcessor
+
+
+def run_benchmark(image_paths, repeat=3, lang='rus', **processor_kwargs):
+    """
+    Прогоняет распознавание изображений без контрольных точек.
+    :return: словарь этап -> среднее время на изображение, секунды.
+    """
+    totals = {}
+    runs = 0
+    for image_path in image_paths:
+        for _ in range(repeat):
+            processor = TableProcessor(image_path, lang=lang, **processor_kwargs)
+            start = time.perf_counter()
+            # Отладочный вывод этапов не должен попадать в результаты замера
+            with contextlib.redirect_stdout(io.StringIO()):
+                processor.extract()
+            totals['total'] = totals.get('total', 0.0) + time.perf_counter() - start
+            for stage, seconds in processor.timings.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+            runs += 1
+    return {stage: seconds / runs for stage, seconds in totals.items()}
+
+
+def print_report(results):
+    stages = []
+    for timings in results.values():
+        stages.extend(stage for stage in timings if stage not in stages)
+    names = list(results)
+    print(f"{'этап':<16}" + ''.join(f"{name:>16}" for name in names))
+    for stage in stages:
+        row = ''.join(
+            f"{1000 * results[name][stage]:>13.1f} мс" if stage in results[name] else f"{'-':>16}"
+            for name in names
+        )
+        print(f"{stage:<16}{row}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Замер времени этапов распознавания таблиц.")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--lang', default='rus')
+    parser.add_argument('--compare-preprocess', action='store_true',
+                        help="сравнить с распознаванием исходных ячеек без подготовки")
+    args = parser.parse_args()
+
+    results = {'preprocess': run_benchmark(args.images, args.repeat, lang=args.lang)}
+    if args.compare_preprocess:
+        results['raw'] = run_benchmark(args.images, args.repeat, lang=args.lang, preprocess=False)
+    print_report(results)
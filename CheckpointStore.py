@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+
+class CheckpointStore:
+    """
+    Дисковое хранилище результатов этапов обработки таблицы.
+
+    Ключ этапа строится из ключей родительских этапов (в начале цепочки —
+    хэш содержимого изображения), имени этапа и его параметров. Поэтому
+    изменение параметров этапа делает недействительным его результат и
+    результаты всех зависящих от него этапов, а более ранние этапы
+    загружаются с диска.
+    """
+
+    SUFFIX = '.pkl'
+
+    def __init__(self, directory='checkpoints', max_entries=1000, max_bytes=1024 * 1024 * 1024,
+                 max_age_days=30):
+        """
+        :param max_entries, max_bytes, max_age_days: ограничения вытеснения;
+            None — ограничения нет.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def image_hash(image_input):
+        """
+        Хэш содержимого изображения: байты файла для пути или данные массива.
+        """
+        digest = hashlib.sha256()
+        if isinstance(image_input, str):
+            with open(image_input, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        elif isinstance(image_input, np.ndarray):
+            digest.update(str((image_input.shape, image_input.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(image_input).data)
+        else:
+            raise TypeError("image_input должен быть либо путем к файлу, либо numpy-массивом.")
+        return digest.hexdigest()
+
+    @staticmethod
+    def stage_key(parents, stage, params=None):
+        """
+        Ключ этапа из ключей родительских этапов, имени этапа и его параметров.
+        """
+        payload = json.dumps([list(parents), stage, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, f"{stage}-{key}{self.SUFFIX}")
+
+    def contains(self, stage, key):
+        """
+        :return: True, если контрольная точка этапа есть на диске.
+        """
+        return os.path.exists(self._path(stage, key))
+
+    def load(self, stage, key, touch=True):
+        """
+        Загружает результат этапа.
+        :param touch: отметить запись как использованную (см. touch()).
+        :return: сохранённое значение или None, если контрольной точки нет.
+        """
+        path = self._path(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError) as e:
+            print(f"Повреждённая контрольная точка '{path}' удалена: {str(e)}")
+            self._remove(path)
+            return None
+        if touch:
+            self.touch(stage, key)
+        return value
+
+    def touch(self, stage, key):
+        """
+        Отмечает запись как использованную: время изменения файла служит
+        временем последнего обращения для вытеснения.
+        """
+        # Файл мог успеть удалить evict() другого потока
+        try:
+            os.utime(self._path(stage, key), None)
+        except FileNotFoundError:
+            pass
+
+    def save(self, stage, key, value):
+        """
+        Атомарно сохраняет результат этапа и при необходимости вытесняет старые записи.
+        """
+        path = self._path(stage, key)
+        # Одну запись могут одновременно сохранять несколько потоков
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        """
+        Список контрольных точек, начиная с самых давно использованных.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stage, _, key = name[:-len(self.SUFFIX)].rpartition('-')
+            entries.append({
+                'stage': stage,
+                'key': key,
+                'path': path,
+                'size': stat.st_size,
+                'last_used': stat.st_mtime
+            })
+        return sorted(entries, key=lambda e: e['last_used'])
+
+    def evict(self):
+        """
+        Вытесняет записи старше max_age_days, а затем самые давно использованные,
+        пока не выполнены ограничения max_entries и max_bytes.
+        :return: количество удалённых записей.
+        """
+        entries = self.entries()
+        removed = 0
+        if self.max_age_days is not None:
+            deadline = time.time() - self.max_age_days * 24 * 3600
+            expired = [e for e in entries if e['last_used'] < deadline]
+            for entry in expired:
+                removed += self._remove(entry['path'])
+            entries = entries[len(expired):]
+        total_bytes = sum(e['size'] for e in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and total_bytes > self.max_bytes)):
+            entry = entries.pop(0)
+            total_bytes -= entry['size']
+            removed += self._remove(entry['path'])
+        return removed
+
+    def clear(self):
+        removed = 0
+        for entry in self.entries():
+            removed += self._remove(entry['path'])
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Управление контрольными точками обработки таблиц.")
+    parser.add_argument('command', choices=['list', 'evict', 'clear'])
+    parser.add_argument('--dir', default='checkpoints')
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.dir)
+    if args.command == 'list':
+        entries = store.entries()
+        for entry in entries:
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))
+            print(f"{entry['stage']:<14} {entry['key'][:16]}  {entry['size']:>10} Б  {last_used}")
+        print(f"Всего записей: {len(entries)}, {sum(e['size'] for e in entries)} Б")
+    elif args.command == 'evict':
+        print(f"Удалено записей: {store.evict()}")
+    else:
+        print(f"Удалено записей: {store.clear()}")
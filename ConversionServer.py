@@ -0,0 +1,360 @@
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from Cropper import Cropper
+from TableProcessor import TableProcessor
+from CheckpointStore import CheckpointStore
+from LayoutRegistry import LayoutRegistry
+
+CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+
+class ConversionJob:
+    """
+    Задание на конвертацию одного изображения.
+    """
+
+    def __init__(self, image_bytes, output_format, lang, padding_x, padding_y, crop):
+        self.image_bytes = image_bytes
+        self.output_format = output_format
+        self.lang = lang
+        self.padding_x = padding_x
+        self.padding_y = padding_y
+        self.crop = crop
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ServiceMetrics:
+    """
+    Потокобезопасные счётчики сервиса и задержки этапов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {'accepted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'active': 0}
+        self.stages = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['last'] = seconds
+
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': stats['count'],
+                    'avg_ms': round(1000 * stats['total'] / stats['count'], 1),
+                    'max_ms': round(1000 * stats['max'], 1),
+                    'last_ms': round(1000 * stats['last'], 1)
+                }
+                for stage, stats in self.stages.items()
+            }
+            return {'counters': dict(self.counters), 'stages': stages}
+
+
+class ConversionService:
+    """
+    Пул рабочих потоков с ограниченной очередью заданий.
+    Модель распознавания структуры загружается один раз при запуске.
+    """
+
+    def __init__(self, workers=2, queue_size=8, lang='rus', structure=False, checkpoints=None, layouts=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.lang = lang
+        self.checkpoints = checkpoints
+        self.layouts = layouts
+        self.metrics = ServiceMetrics()
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.structure_finder = None
+        self._structure_lock = threading.Lock()
+        if structure:
+            from StructureFinder import StructureFinder
+            start = time.perf_counter()
+            self.structure_finder = StructureFinder()
+            print(f"Модель распознавания структуры загружена за {time.perf_counter() - start:.1f} с")
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"converter-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job):
+        """
+        Ставит задание в очередь.
+        :raises queue.Full: если очередь заполнена.
+        """
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.metrics.increment('rejected')
+            raise
+        self.metrics.increment('accepted')
+
+    def health(self):
+        snapshot = self.metrics.snapshot()
+        snapshot.update({
+            'status': 'ok',
+            'queue_depth': self.jobs.qsize(),
+            'queue_size': self.queue_size,
+            'workers': self.workers,
+            'structure_model': self.structure_finder is not None
+        })
+        return snapshot
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            self.metrics.increment('active')
+            try:
+                job.result = self._convert(job)
+                self.metrics.increment('completed')
+            except Exception as e:
+                job.error = str(e)
+                self.metrics.increment('failed')
+                print(f"Ошибка конвертации: {str(e)}")
+            finally:
+                self.metrics.increment('active', -1)
+                job.done.set()
+                self.jobs.task_done()
+
+    def _timed(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.metrics.record(stage, time.perf_counter() - start)
+
+    def _convert(self, job):
+        work_dir = tempfile.mkdtemp(prefix='table_conversion_')
+        try:
+            image = self._timed('decode', cv2.imdecode,
+                                np.frombuffer(job.image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Не удалось декодировать изображение.")
+
+            if job.crop:
+                cropped = self._timed('crop', Cropper(image).extract_table, job.padding_x, job.padding_y)
+                if cropped is None:
+                    raise ValueError("Не удалось извлечь таблицу.")
+                image = cropped
+            image_path = os.path.join(work_dir, 'table.png')
+            cv2.imwrite(image_path, image)
+
+            structure = None
+            if self.structure_finder is not None:
+                with self._structure_lock:
+                    detection = self._timed('structure_finder', self.structure_finder.detect,
+                                            image_path, resize_factor=1, threshold=0.97)
+                if detection:
+                    id2label = self.structure_finder.model.config.id2label
+                    structure = [
+                        {'label': id2label[label.item()], 'score': round(score.item(), 4),
+                         'box': [round(coord.item(), 1) for coord in box]}
+                        for score, label, box in zip(detection['scores'], detection['labels'],
+                                                     detection['boxes'])
+                    ]
+
+            excel_path = os.path.join(work_dir, 'table.xlsx')
+            processor = TableProcessor(image_path, excel_path, lang=job.lang or self.lang,
+                                       checkpoints=self.checkpoints, layouts=self.layouts)
+            processor.process()
+            for stage, seconds in processor.timings.items():
+                self.metrics.record(stage, seconds)
+
+            if job.output_format == 'xlsx':
+                with open(excel_path, 'rb') as f:
+                    return f.read()
+            if job.output_format == 'csv':
+                return self.to_csv(processor.cells_dict, processor.cell_results).encode('utf-8')
+            return json.dumps({
+                'cells': [
+                    {
+                        'cells': result['cells'],
+                        'text': result['text'],
+                        'profile': result['profile'],
+                        'confidence': result['confidence'],
+                        'retries': result['retries']
+                    }
+                    for result in processor.cell_results
+                ],
+                'retry_count': processor.retry_count,
+                'structure': structure,
+                'timings_ms': {stage: round(1000 * s, 1) for stage, s in processor.timings.items()}
+            }, ensure_ascii=False).encode('utf-8')
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def to_csv(cells_dict, cell_results):
+        """
+        Раскладывает распознанный текст по сетке Excel-ячеек; текст объединённой
+        области записывается в её левую верхнюю ячейку.
+        """
+        from openpyxl.utils import column_index_from_string
+        from ExcelHelper import ExcelHelper
+
+        positions = [ExcelHelper.split_cell_name(cell) for cell in cells_dict]
+        max_row = max((row for _, row in positions), default=0)
+        max_col = max((column_index_from_string(col) for col, _ in positions), default=0)
+        grid = [[''] * max_col for _ in range(max_row)]
+        for result in cell_results:
+            col, row = ExcelHelper.split_cell_name(result['cells'][0])
+            grid[row - 1][column_index_from_string(col) - 1] = result['text']
+        output = io.StringIO()
+        csv.writer(output).writerows(grid)
+        return output.getvalue()
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    max_upload_bytes = 50 * 1024 * 1024
+    request_timeout = 600
+
+    def do_GET(self):
+        if urlparse(self.path).path in ('/health', '/metrics'):
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self._send_json(404, {'error': 'not found'})
+            return
+        query = parse_qs(url.query)
+        output_format = query.get('format', ['xlsx'])[0]
+        if output_format not in CONTENT_TYPES:
+            self._send_json(400, {'error': f"неизвестный формат '{output_format}'"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_json(400, {'error': 'пустое тело запроса'})
+            return
+        if length > self.max_upload_bytes:
+            self._send_json(413, {'error': 'слишком большой файл'})
+            return
+        try:
+            job = ConversionJob(
+                self.rfile.read(length),
+                output_format,
+                lang=query.get('lang', [None])[0],
+                padding_x=int(query.get('padding_x', ['10'])[0]),
+                padding_y=int(query.get('padding_y', ['10'])[0]),
+                crop=query.get('crop', ['1'])[0] != '0'
+            )
+        except ValueError:
+            self._send_json(400, {'error': 'некорректные параметры'})
+            return
+
+        try:
+            self.service.submit(job)
+        except queue.Full:
+            self._send_json(429, {'error': 'очередь заполнена'}, {'Retry-After': '1'})
+            return
+
+        if not job.done.wait(self.request_timeout):
+            self._send_json(504, {'error': 'превышено время ожидания'})
+            return
+        if job.error is not None:
+            self._send_json(422, {'error': job.error})
+            return
+        self._send(200, job.result, CONTENT_TYPES[output_format])
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                   CONTENT_TYPES['json'], headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(host='127.0.0.1', port=8765, **service_kwargs):
+    ConversionRequestHandler.service = ConversionService(**service_kwargs)
+    server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    print(f"Сервис конвертации запущен на http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def convert_file(image_path, output_path, output_format='xlsx', url='http://127.0.0.1:8765'):
+    """
+    Локальный клиент: отправляет изображение сервису и сохраняет ответ.
+    """
+    with open(image_path, 'rb') as f:
+        request = urllib.request.Request(f"{url}/convert?format={output_format}", data=f.read(),
+                                         headers={'Content-Type': 'application/octet-stream'})
+    with urllib.request.urlopen(request) as response, open(output_path, 'wb') as out:
+        out.write(response.read())
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервис конвертации таблиц.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--workers', type=int, default=2)
+    serve_parser.add_argument('--queue-size', type=int, default=8)
+    serve_parser.add_argument('--lang', default='rus')
+    serve_parser.add_argument('--structure', action='store_true',
+                              help="загрузить модель распознавания структуры")
+    serve_parser.add_argument('--checkpoints', action='store_true',
+                              help="использовать контрольные точки этапов")
+    serve_parser.add_argument('--layouts', action='store_true',
+                              help="использовать реестр разметок повторяющихся бланков")
+
+    client_parser = subparsers.add_parser('convert')
+    client_parser.add_argument('image')
+    client_parser.add_argument('output')
+    client_parser.add_argument('--format', default='xlsx', choices=list(CONTENT_TYPES))
+    client_parser.add_argument('--url', default='http://127.0.0.1:8765')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.host, args.port, workers=args.workers, queue_size=args.queue_size, lang=args.lang,
+              structure=args.structure, checkpoints=CheckpointStore() if args.checkpoints else None,
+              layouts=LayoutRegistry() if args.layouts else None)
+    else:
+        print(f"Результат сохранён: {convert_file(args.image, args.output, args.format, args.url)}")
@@ -3,6 +3,8 @@ import numpy as np
 class Cropper:
     """
     Класс для извлечения таблицы с изображения.
+    Найденные контуры и рамка таблицы кэшируются, поэтому повторное извлечение
+    с другими отступами только заново вырезает область из изображения.
     """
 
     def __init__(self, image_input):
@@ -14,6 +16,8 @@ class Cropper:
             self.image = image_input
         else:
             raise TypeError("image_input должен быть либо путем к файлу, либо numpy-массивом.")
+        self._contours = None
+        self._table_bbox = None
 
     def extract_and_save_table(self, output_path, padding_x=10, padding_y=10):
         """
@@ -35,7 +39,63 @@ class Cropper:
         Извлекает область таблицы с изображения.
         :return: numpy array с обрезанным изображением или None.
         """
-        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        bbox = self.table_bbox()
+        if bbox is None:
+            return None
+        x, y, w, h = self._apply_padding(*bbox, padding_x, padding_y)
+        return self.image[y:y + h, x:x + w]
+
+    def table_bbox(self):
+        """
+        Рамка самой большой таблицы без отступов.
+        :return: (x, y, w, h) или None, если таблица не найдена.
+        """
+        if self._table_bbox is None:
+            contours = self._find_table_contours()
+            if not contours:
+                return None
+            self._table_bbox = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        return self._table_bbox
+
+    def find_table_regions(self, min_area_ratio=0.01):
+        """
+        Находит все таблицы на изображении.
+        :param min_area_ratio: минимальная доля площади изображения, занимаемая таблицей.
+        :return: список (x, y, w, h) в порядке чтения: сверху вниз, в одной полосе — слева направо.
+        """
+        min_area = min_area_ratio * self.image.shape[0] * self.image.shape[1]
+        boxes = [cv2.boundingRect(cnt) for cnt in self._find_table_contours()]
+        boxes = sorted((box for box in boxes if box[2] * box[3] >= min_area), key=lambda b: b[1])
+
+        # Таблицы, пересекающиеся по вертикали, относятся к одной полосе
+        bands = []
+        for box in boxes:
+            if bands and box[1] < bands[-1]['bottom']:
+                bands[-1]['boxes'].append(box)
+                bands[-1]['bottom'] = max(bands[-1]['bottom'], box[1] + box[3])
+            else:
+                bands.append({'boxes': [box], 'bottom': box[1] + box[3]})
+        return [box for band in bands for box in sorted(band['boxes'], key=lambda b: b[0])]
+
+    def extract_tables(self, padding_x=0, padding_y=0, min_area_ratio=0.01):
+        """
+        Извлекает все таблицы с изображения.
+        :return: список numpy array с обрезанными изображениями в порядке чтения.
+        """
+        tables = []
+        for x, y, w, h in self.find_table_regions(min_area_ratio):
+            x, y, w, h = self._apply_padding(x, y, w, h, padding_x, padding_y)
+            tables.append(self.image[y:y + h, x:x + w])
+        return tables
+
+    def _find_table_contours(self):
+        """Находит внешние контуры сетки линий на изображении"""
+        if self._contours is None:
+            self._contours = self._detect_table_contours()
+        return self._contours
+
+    def _detect_table_contours(self):
+        gray = self.image if self.image.ndim == 2 else cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
         gray_inv = cv2.bitwise_not(gray)
         binary = cv2.adaptiveThreshold(
             gray_inv, 255,
@@ -50,11 +110,7 @@ class Cropper:
             cv2.RETR_EXTERNAL,
             cv2.CHAIN_APPROX_SIMPLE
         )
-        if not contours:
-            return None
-        x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
-        x, y, w, h = self._apply_padding(x, y, w, h, padding_x, padding_y)
-        return self.image[y:y + h, x:x + w]
+        return contours
 
     def _get_lines(self, binary_img, axis):
         """Вспомогательный метод для выделения линий"""
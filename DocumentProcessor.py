@@ -0,0 +1,196 @@
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from Cropper import Cropper
+from JsonLinesWriter import JsonLinesWriter
+from MemoryMonitor import MemoryMonitor
+from PageStream import PageStream
+from RetryBudget import RetryBudget
+from TableProcessor import TableProcessor
+
+
+class DocumentProcessor:
+    """
+    Потоковая обработка многостраничных документов в одну Excel-книгу.
+
+    Страницы декодируются отдельным потоком в очередь ограниченного размера
+    и обрабатываются рабочими потоками (обрезка -> детектирование -> OCR),
+    поэтому одновременно в памяти находится не больше prefetch + workers
+    страниц независимо от длины документа. Для каждой страницы создаётся свой лист.
+
+    В режиме multi_table со страницы извлекаются все таблицы, они распознаются
+    параллельно, и каждая записывается на отдельный лист.
+
+    В режиме low_memory страницы декодируются сразу в оттенки серого,
+    а для каждой страницы сообщается пиковый RSS процесса.
+
+    Если задан jsonl_filename, результаты ячеек всех страниц по мере распознавания
+    дописываются в этот файл в формате JSON Lines с названием страницы и номером таблицы.
+    """
+
+    _DONE = object()
+
+    def __init__(self, source, excel_filename, lang='rus', crop=True, padding_x=10, padding_y=10,
+                 workers=1, prefetch=2, checkpoints=None, multi_table=False, table_workers=4,
+                 min_table_area_ratio=0.01, low_memory=False, jsonl_filename=None,
+                 layouts=None, retry_budget=20):
+        self.low_memory = low_memory
+        self.pages = PageStream(source, cv2.IMREAD_GRAYSCALE if low_memory else cv2.IMREAD_COLOR)
+        self.excel_filename = excel_filename
+        self.lang = lang
+        self.crop = crop
+        self.padding_x = padding_x
+        self.padding_y = padding_y
+        self.workers = workers
+        self.prefetch = prefetch
+        self.checkpoints = checkpoints
+        self.layouts = layouts
+        # Бюджет повторного распознавания ячеек на страницу
+        self.retry_budget = retry_budget
+        self.multi_table = multi_table
+        self.table_workers = table_workers
+        self.min_table_area_ratio = min_table_area_ratio
+        self.errors = {}
+        # Пиковый RSS процесса при обработке каждой страницы, байты
+        self.page_peak_rss = {}
+        self.jsonl_filename = jsonl_filename
+        self._table_pool = None
+        self._jsonl = None
+
+    def process_page(self, image, name=None):
+        """
+        Обрабатывает одну страницу.
+        :return: список (cells_dict, cell_results) для каждой найденной таблицы.
+        """
+        if not self.crop:
+            return [self._process_table(image, name)]
+        cropper = Cropper(image)
+        if not self.multi_table:
+            cropped = cropper.extract_table(self.padding_x, self.padding_y)
+            if cropped is None:
+                raise ValueError("Не удалось извлечь таблицу.")
+            return [self._process_table(cropped, name)]
+        tables = cropper.extract_tables(self.padding_x, self.padding_y, self.min_table_area_ratio)
+        if not tables:
+            raise ValueError("Не удалось извлечь таблицу.")
+        # Таблицы страницы расходуют общий бюджет повторного распознавания
+        budget = RetryBudget(self.retry_budget)
+        return list(self._table_pool.map(self._process_table, tables, [name] * len(tables),
+                                         range(1, len(tables) + 1), [budget] * len(tables)))
+
+    def _process_table(self, image, name=None, table=1, retry_budget=None):
+        processor = TableProcessor(image, lang=self.lang, checkpoints=self.checkpoints,
+                                   low_memory=self.low_memory, layouts=self.layouts,
+                                   monitor_memory=False,
+                                   retry_budget=self.retry_budget if retry_budget is None else retry_budget)
+        if self._jsonl is None:
+            return processor.extract()
+
+        def write_result(result):
+            self._jsonl.write(result, page=name, table=table)
+        return processor.extract(write_result)
+
+    def _read_pages(self, pages_queue):
+        try:
+            for index, (name, image) in enumerate(self.pages):
+                pages_queue.put((index, name, image))
+                del image
+        except Exception as e:
+            pages_queue.put((None, None, e))
+        finally:
+            for _ in range(self.workers):
+                pages_queue.put((None, None, self._DONE))
+
+    def _process_pages(self, pages_queue, results):
+        while True:
+            index, name, image = pages_queue.get()
+            if image is self._DONE:
+                return
+            if isinstance(image, Exception):
+                self.errors[None] = image
+                continue
+            start = time.perf_counter()
+            monitor = MemoryMonitor() if self.low_memory else None
+            try:
+                if monitor is not None:
+                    with monitor:
+                        tables = self.process_page(image, name)
+                    self.page_peak_rss[name] = monitor.peak_rss
+                    print(f"Страница '{name}': пиковое RSS {monitor.peak_rss_mb:.1f} МБ")
+                else:
+                    tables = self.process_page(image, name)
+                if len(tables) == 1:
+                    results[index] = [(name,) + tables[0]]
+                else:
+                    results[index] = [(f"{name} табл. {i + 1}",) + table for i, table in enumerate(tables)]
+                print(f"Страница '{name}' обработана за {time.perf_counter() - start:.1f} с")
+            except Exception as e:
+                self.errors[name] = e
+                print(f"Ошибка обработки страницы '{name}': {str(e)}")
+            del image
+
+    def process(self):
+        """
+        Обрабатывает все страницы и сохраняет книгу с листом на каждую страницу или таблицу.
+        :return: имя созданного файла.
+        """
+        self.errors = {}
+        self.page_peak_rss = {}
+        results = {}
+        pages_queue = queue.Queue(maxsize=self.prefetch)
+        reader = threading.Thread(target=self._read_pages, args=(pages_queue,), daemon=True)
+        workers = [
+            threading.Thread(target=self._process_pages, args=(pages_queue, results), daemon=True)
+            for _ in range(self.workers)
+        ]
+        self._table_pool = ThreadPoolExecutor(max_workers=self.table_workers) if self.multi_table else None
+        self._jsonl = JsonLinesWriter(self.jsonl_filename) if self.jsonl_filename else None
+        try:
+            reader.start()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            reader.join()
+        finally:
+            if self._table_pool is not None:
+                self._table_pool.shutdown()
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+        if None in self.errors:
+            raise self.errors[None]
+        from ExcelHelper import ExcelHelper
+
+        sheets = [sheet for index in sorted(results) for sheet in results[index]]
+        return ExcelHelper.create_workbook(self.excel_filename, sheets)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Конвертация многостраничных документов в Excel.")
+    parser.add_argument('source', help="многостраничный TIFF, изображение или каталог с изображениями")
+    parser.add_argument('output')
+    parser.add_argument('--lang', default='rus')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--prefetch', type=int, default=2)
+    parser.add_argument('--no-crop', action='store_true')
+    parser.add_argument('--multi-table', action='store_true', help="распознавать все таблицы на странице")
+    parser.add_argument('--table-workers', type=int, default=4)
+    parser.add_argument('--low-memory', action='store_true',
+                        help="декодировать в оттенки серого и сообщать пиковый RSS каждой страницы")
+    parser.add_argument('--jsonl', default=None, help="дополнительно писать ячейки в файл JSON Lines")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(args.source, args.output, lang=args.lang, crop=not args.no_crop,
+                                  workers=args.workers, prefetch=args.prefetch,
+                                  multi_table=args.multi_table, table_workers=args.table_workers,
+                                  low_memory=args.low_memory, jsonl_filename=args.jsonl)
+    processor.process()
+    for page, error in processor.errors.items():
+        print(f"Страница '{page}' пропущена: {str(error)}")
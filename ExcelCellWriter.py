@@ -0,0 +1,46 @@
+import openpyxl
+from openpyxl.styles import Font
+
+from ExcelHelper import ExcelHelper
+
+
+class ExcelCellWriter:
+    """
+    Запись результатов распознавания в Excel-файл по мере их поступления.
+
+    Рамки сетки рисуются при открытии, каждая распознанная ячейка сразу
+    записывается на лист, а книга сохраняется при выходе из with — в том числе
+    при ошибке посреди страницы, так что уже распознанные ячейки не теряются.
+    """
+
+    def __init__(self, excel_name, cells_dict, sheet_title=None):
+        self.excel_name = excel_name
+        self.wb = openpyxl.Workbook()
+        self.ws = self.wb.active
+        if sheet_title is not None:
+            self.ws.title = ExcelHelper.sheet_title(sheet_title)
+        ExcelHelper.draw_borders(self.ws, cells_dict)
+        self.font = Font(name='Times New Roman', size=14)
+        self.written = 0
+
+    def write(self, result):
+        """
+        Записывает результат одной ячейки (словарь с ключами cells и text).
+        """
+        ExcelHelper.write_cell(self.ws, result['cells'], result['text'], self.font)
+        self.written += 1
+
+    def close(self, partial=False):
+        ExcelHelper.fit_dimensions(self.ws)
+        self.wb.save(self.excel_name)
+        if partial:
+            print(f"Обработка прервана, в файл '{self.excel_name}' записано ячеек: {self.written}")
+        else:
+            print(f"Обработка закончена, файл '{self.excel_name}' создан.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(partial=exc_type is not None)
+        return False
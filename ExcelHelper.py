@@ -1,5 +1,4 @@
 import re
-import pandas as pd
 import openpyxl
 from openpyxl.styles import Border, Side, Font, Alignment
 from openpyxl.utils import get_column_letter, column_index_from_string
@@ -8,18 +7,22 @@ from openpyxl.utils import get_column_letter, column_index_from_string
 class ExcelHelper:
     @staticmethod
     def create_df(cells_dict):
+        import pandas as pd
+
         cell_data = [[None] for _ in cells_dict.keys()]
         df = pd.DataFrame(cell_data, index=list(cells_dict.keys()), columns=["Cell"])
         return df
 
     @staticmethod
-    def create_empty_excel_file(cells_dict, file_name='images/empty_table_with_borders.xlsx'):
-        max_col = max([column_index_from_string(ExcelHelper.split_cell_name(cell)[0]) for cell in cells_dict.keys()])
-        max_row = max([ExcelHelper.split_cell_name(cell)[1] for cell in cells_dict.keys()])
+    def draw_borders(ws, cells_dict):
+        """
+        Рисует рамки для всех ячеек листа, покрываемых сеткой таблицы.
+        """
+        max_col = max([column_index_from_string(ExcelHelper.split_cell_name(cell)[0]) for cell in cells_dict.keys()],
+                      default=0)
+        max_row = max([ExcelHelper.split_cell_name(cell)[1] for cell in cells_dict.keys()], default=0)
         print("Макс. номер колонки:", max_col)
         print("Макс. номер строки:", max_row)
-        wb = openpyxl.Workbook()
-        ws = wb.active
         border_style = Border(
             left=Side(style='thick'),
             right=Side(style='thick'),
@@ -30,9 +33,6 @@ class ExcelHelper:
             for col in range(1, max_col + 1):
                 cell = ws.cell(row=row, column=col)
                 cell.border = border_style
-        wb.save(file_name)
-        print(f"Excel-файл сохранён как '{file_name}'")
-        return file_name
 
     @staticmethod
     def split_cell_name(cell):
@@ -44,28 +44,62 @@ class ExcelHelper:
             raise ValueError(f"Некорректное имя ячейки: {cell}")
 
     @staticmethod
-    def create_excel(excel_name, text_to_cells):
-        file_name = 'images/empty_table_with_borders.xlsx'
-        wb = openpyxl.load_workbook(file_name)
-        ws = wb.active
+    def create_workbook(excel_name, sheets):
+        """
+        Создаёт книгу с отдельным листом для каждой таблицы.
+        :param sheets: последовательность (название листа, cells_dict, cell_results).
+        """
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        for title, cells_dict, cell_results in sheets:
+            ws = wb.create_sheet(ExcelHelper.sheet_title(title))
+            ExcelHelper.draw_borders(ws, cells_dict)
+            ExcelHelper.fill_sheet(ws, cell_results)
+        if not wb.sheetnames:
+            wb.create_sheet()
+        wb.save(excel_name)
+        print(f"Обработка закончена, файл '{excel_name}' создан.")
+        return excel_name
+
+    @staticmethod
+    def sheet_title(title):
+        """Приводит название к допустимому имени листа Excel"""
+        return re.sub(r'[\\/*?:\[\]]', '_', title)[:31]
 
+    @staticmethod
+    def fill_sheet(ws, cell_results):
+        """
+        Заполняет лист результатами распознавания.
+        :param cell_results: последовательность словарей с ключами cells и text.
+        """
         font = Font(name='Times New Roman', size=14)
-        min_column_width = 1
+        for result in cell_results:
+            ExcelHelper.write_cell(ws, result['cells'], result['text'], font)
+        ExcelHelper.fit_dimensions(ws)
+
+    @staticmethod
+    def write_cell(ws, cells, text, font):
+        """
+        Объединяет Excel-ячейки, покрываемые ячейкой таблицы, и записывает в них текст.
+        """
+        print("Обрабатываем ячейки:", cells)
+        col_start = column_index_from_string(ExcelHelper.split_cell_name(cells[0])[0])
+        row_start = ExcelHelper.split_cell_name(cells[0])[1]
+        col_end = column_index_from_string(ExcelHelper.split_cell_name(cells[-1])[0])
+        row_end = ExcelHelper.split_cell_name(cells[-1])[1]
 
-        for text, cells in text_to_cells.items():
-            print("Обрабатываем ячейки:", cells)
-            col_start = column_index_from_string(ExcelHelper.split_cell_name(cells[0])[0])
-            row_start = ExcelHelper.split_cell_name(cells[0])[1]
-            col_end = column_index_from_string(ExcelHelper.split_cell_name(cells[-1])[0])
-            row_end = ExcelHelper.split_cell_name(cells[-1])[1]
+        ws.merge_cells(start_row=row_start, start_column=col_start,
+                       end_row=row_end, end_column=col_end)
+        cell = ws.cell(row=row_start, column=col_start)
+        if not isinstance(cell, openpyxl.cell.MergedCell):
+            cell.value = text
+        cell.alignment = Alignment(horizontal='left', vertical='center')
+        cell.font = font
 
-            ws.merge_cells(start_row=row_start, start_column=col_start,
-                           end_row=row_end, end_column=col_end)
-            cell = ws.cell(row=row_start, column=col_start)
-            if not isinstance(cell, openpyxl.cell.MergedCell):
-                cell.value = text
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.font = font
+    @staticmethod
+    def fit_dimensions(ws):
+        """Подбирает ширину столбцов и высоту строк по записанному тексту"""
+        min_column_width = 1
 
         for col_idx in range(1, ws.max_column + 1):
             col_letter = get_column_letter(col_idx)
@@ -83,6 +117,3 @@ class ExcelHelper:
                     lines = cell_value.split('\n')
                     max_text_height = max(max_text_height, len(lines))
             ws.row_dimensions[row_idx].height = min(max_text_height * 12, 1000)
-
-        wb.save(excel_name)
-        print(f"Обработка закончена, файл '{excel_name}' создан.")
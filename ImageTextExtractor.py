@@ -1,29 +1,271 @@
 import cv2
 import re
-import pytesseract
+import time
+import numpy as np
+
+from RetryBudget import RetryBudget
 
 
 class ImageTextExtractor:
-    def __init__(self, image_path, lang='rus'):
-        self.image = cv2.imread(image_path)
+    # Профили распознавания: режим сегментации страницы tesseract и белый список символов
+    OCR_PROFILES = {
+        'block': r'--psm 6',
+        'line': r'--psm 7',
+        'word': r'--psm 8',
+        'numeric_line': r'--psm 7 -c tessedit_char_whitelist=0123456789.,-+%',
+        'numeric_word': r'--psm 8 -c tessedit_char_whitelist=0123456789.,-+%',
+    }
+    # Профиль для повторного распознавания ячейки с низкой уверенностью;
+    # числовые профили уступают обычным на случай ошибочного белого списка
+    ALTERNATIVE_PROFILES = {
+        'block': 'line',
+        'line': 'block',
+        'word': 'line',
+        'numeric_line': 'line',
+        'numeric_word': 'word',
+    }
+    # Увеличение ячейки при повторном распознавании
+    RETRY_SCALE = 2
+    # Край ячейки срезается, пока доля пикселей линий разметки в крайней строке
+    # или столбце не меньше LINE_MARGIN_RATIO, но не больше MAX_MARGIN_FRACTION размера ячейки
+    LINE_MARGIN_RATIO = 0.5
+    MAX_MARGIN_FRACTION = 0.25
+    # Ячейка с меньшим числом пикселей текста считается пустой (остатки линий, шум)
+    MIN_INK_PIXELS = 5
+    # Белое поле вокруг подготовленной ячейки: tesseract хуже распознаёт текст у самого края
+    CELL_BORDER = 4
+    NUMERIC_PATTERN = re.compile(r'^[\d\s.,\-+%]+$')
+    # Высота строки текста относительно медианной высоты символа
+    LINE_HEIGHT_FACTOR = 1.5
+    # Ячейка ниже двух строк текста считается однострочной,
+    # однострочная ячейка уже WORD_WIDTH_FACTOR высот строки — одним словом
+    WORD_WIDTH_FACTOR = 4
+    # Столбец считается числовым, если среди первых NUMERIC_COLUMN_MIN_SAMPLES непустых
+    # ячеек не меньше NUMERIC_COLUMN_RATIO содержат только цифры; выборка такова,
+    # что одна ячейка заголовка (4 числа из 5) не мешает признать столбец числовым
+    NUMERIC_COLUMN_MIN_SAMPLES = 5
+    NUMERIC_COLUMN_RATIO = 0.8
+
+    def __init__(self, image_input, lang='rus', min_confidence=60, retry_budget=20,
+                 binary=None, line_mask=None):
+        """
+        :param min_confidence: ячейки с уверенностью tesseract ниже этого порога
+            распознаются повторно.
+        :param retry_budget: максимальное число повторных распознаваний или RetryBudget,
+            общий для всех таблиц страницы; число действует только на эту таблицу.
+        :param binary: бинаризованная страница (текст белым по чёрному, как TableDetector.thresh).
+        :param line_mask: маска линий разметки той же страницы (TableDetector.line_mask()).
+            Если заданы обе, в tesseract передаётся подготовленная одноканальная ячейка
+            без линий разметки, а ячейки без текста не распознаются вовсе.
+        """
+        if isinstance(image_input, str):
+            self.image = cv2.imread(image_input)
+            if self.image is None:
+                raise ValueError("Не удалось загрузить изображение по указанному пути.")
+        elif isinstance(image_input, np.ndarray):
+            self.image = image_input
+        else:
+            raise TypeError("image_input должен быть либо путем к файлу, либо numpy-массивом.")
         self.lang = lang
+        self.binary = binary
+        self.line_mask = line_mask
+        self.min_confidence = min_confidence
+        self.retry_budget = retry_budget if isinstance(retry_budget, RetryBudget) else RetryBudget(retry_budget)
+        self.line_height = None
+        # Результаты по ячейкам таблицы: выбранный профиль распознавания, текст,
+        # средняя уверенность tesseract по словам (None для пустых ячеек)
+        # и число повторных распознаваний
+        self.cell_profiles = {}
+        self.cell_texts = {}
+        self.cell_confidences = {}
+        self.cell_retries = {}
+        self.retry_count = 0
+        # Суммарное время подготовки ячеек и работы tesseract, секунды
+        self.timings = {'preprocess': 0.0, 'tesseract': 0.0}
 
-    def extract_text_from_image(self, coordinates):
+    def estimate_line_height(self):
+        """
+        Оценивает высоту строки текста по медианной высоте связных компонент
+        бинаризованного изображения (линии таблицы отбрасываются по пропорциям).
+        """
+        if self.binary is not None:
+            thresh = self.binary
+        else:
+            gray = self.image if self.image.ndim == 2 else cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+            thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+        _, _, stats, _ = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        glyphs = (heights >= 4) & (heights <= thresh.shape[0] // 10) & (widths <= 5 * heights)
+        if not np.any(glyphs):
+            return None
+        return float(np.median(heights[glyphs])) * self.LINE_HEIGHT_FACTOR
+
+    def choose_profile(self, coordinates, column_stats=None):
+        """
+        Выбирает профиль распознавания по геометрии ячейки и статистике её столбца.
+        """
         x1, y1, x2, y2 = coordinates
-        cropped_image = self.image[y1:y2, x1:x2]
-        custom_config = r'--psm 6'
-        text = pytesseract.image_to_string(cropped_image, config=custom_config, lang=self.lang)
-        return text.strip()
+        if not self.line_height or (y2 - y1) >= 2 * self.line_height:
+            return 'block'
+        profile = 'word' if (x2 - x1) < self.WORD_WIDTH_FACTOR * self.line_height else 'line'
+        if column_stats and column_stats['total'] >= self.NUMERIC_COLUMN_MIN_SAMPLES and \
+                column_stats['numeric'] >= self.NUMERIC_COLUMN_RATIO * column_stats['total']:
+            profile = f'numeric_{profile}'
+        return profile
+
+    def preprocess_cell(self, coordinates):
+        """
+        Готовит ячейку к распознаванию по уже бинаризованной странице: срезает поля
+        с линиями разметки, удаляет остатки линий и возвращает чёрный текст на белом.
+        :return: одноканальное изображение или None, если в ячейке нет текста.
+        """
+        x1, y1, x2, y2 = coordinates
+        ink = self.binary[y1:y2, x1:x2]
+        lines = self.line_mask[y1:y2, x1:x2]
+        if ink.size == 0:
+            return None
+
+        row_is_line = np.count_nonzero(lines, axis=1) >= self.LINE_MARGIN_RATIO * lines.shape[1]
+        col_is_line = np.count_nonzero(lines, axis=0) >= self.LINE_MARGIN_RATIO * lines.shape[0]
+        top, bottom = self._margins(row_is_line)
+        left, right = self._margins(col_is_line)
+        text_ink = cv2.subtract(ink[top:bottom, left:right], lines[top:bottom, left:right])
+        if cv2.countNonZero(text_ink) < self.MIN_INK_PIXELS:
+            return None
+        return cv2.copyMakeBorder(cv2.bitwise_not(text_ink), self.CELL_BORDER, self.CELL_BORDER,
+                                  self.CELL_BORDER, self.CELL_BORDER, cv2.BORDER_CONSTANT, value=255)
+
+    def _margins(self, is_line):
+        """Границы содержимого после среза крайних строк (столбцов) с линиями разметки"""
+        size = len(is_line)
+        max_margin = int(size * self.MAX_MARGIN_FRACTION)
+        start = 0
+        while start < max_margin and is_line[start]:
+            start += 1
+        end = size
+        while size - end < max_margin and is_line[end - 1]:
+            end -= 1
+        return start, end
+
+    def _cell_image(self, coordinates):
+        start = time.perf_counter()
+        try:
+            if self.binary is not None and self.line_mask is not None:
+                return self.preprocess_cell(coordinates)
+            x1, y1, x2, y2 = coordinates
+            return self.image[y1:y2, x1:x2]
+        finally:
+            self.timings['preprocess'] += time.perf_counter() - start
+
+    def extract_text_from_image(self, coordinates, profile='block'):
+        cropped_image = self._cell_image(coordinates)
+        if cropped_image is None:
+            return ''
+        text, _ = self._recognize(cropped_image, profile)
+        return text
+
+    def recognize_cell(self, coordinates, profile='block'):
+        """
+        Распознаёт ячейку; при уверенности ниже min_confidence, пока не исчерпан бюджет
+        страницы, повторяет распознавание на увеличенном изображении и с другим профилем.
+        Подготовленная ячейка заведомо содержит текст, поэтому она повторяется
+        и тогда, когда tesseract не нашёл в ней ни одного слова.
+        :return: (текст, уверенность, число повторных распознаваний)
+        """
+        cropped_image = self._cell_image(coordinates)
+        if cropped_image is None:
+            return '', None, 0
+        text, confidence = self._recognize(cropped_image, profile)
+        retries = 0
+        if confidence is None and (self.binary is None or self.line_mask is None):
+            return text, confidence, retries
+        if confidence is not None and confidence >= self.min_confidence:
+            return text, confidence, retries
+
+        for image, retry_profile in self._refinements(cropped_image, profile):
+            if not self.retry_budget.acquire():
+                break
+            self.retry_count += 1
+            retries += 1
+            retry_text, retry_confidence = self._recognize(image, retry_profile)
+            if retry_confidence is not None and (confidence is None or retry_confidence > confidence):
+                text, confidence = retry_text, retry_confidence
+            if confidence is not None and confidence >= self.min_confidence:
+                break
+        return text, confidence, retries
+
+    def _refinements(self, cropped_image, profile):
+        """Варианты повторного распознавания: увеличенная ячейка, затем её бинаризация с другим профилем"""
+        upscaled = cv2.resize(cropped_image, None, fx=self.RETRY_SCALE, fy=self.RETRY_SCALE,
+                              interpolation=cv2.INTER_CUBIC)
+        yield upscaled, profile
+        gray = upscaled if upscaled.ndim == 2 else cv2.cvtColor(upscaled, cv2.COLOR_BGR2GRAY)
+        binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        yield binary, self.ALTERNATIVE_PROFILES[profile]
+
+    def _recognize(self, image, profile):
+        """
+        Распознаёт изображение одним вызовом tesseract.
+        :return: (текст, средняя уверенность по словам или None, если слов нет)
+        """
+        import pytesseract
+
+        start = time.perf_counter()
+        data = pytesseract.image_to_data(image, config=self.OCR_PROFILES[profile], lang=self.lang,
+                                         output_type=pytesseract.Output.DICT)
+        self.timings['tesseract'] += time.perf_counter() - start
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            confidence = float(data['conf'][i])
+            if not word or confidence < 0:
+                continue
+            line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            lines.setdefault(line_key, []).append(word)
+            confidences.append(confidence)
+        text = '\n'.join(' '.join(words) for words in lines.values())
+        confidence = sum(confidences) / len(confidences) if confidences else None
+        return text, confidence
 
-    def create_text_to_cells(self, associated_cells):
-        text_to_cells = {}
+    def iter_cell_results(self, associated_cells):
+        """
+        Распознаёт ячейки таблицы по одной и отдаёт результат каждой сразу после
+        распознавания, не дожидаясь остальных.
+        :return: генератор словарей с ключами coordinates (координаты ячейки изображения),
+            cells (Excel-ячейки), text, confidence, profile и retries.
+        """
+        if self.line_height is None:
+            self.line_height = self.estimate_line_height()
+        columns = {}
         for coordinates, excel_labels in associated_cells.items():
-            extracted_text = self.extract_text_from_image(coordinates)
-            text_to_cells[extracted_text] = excel_labels
-        for text, excel_labels in text_to_cells.items():
-            print(f"Text '{text}' is associated with cells: {', '.join(excel_labels)}")
-        print(text_to_cells)
-        return text_to_cells
+            column_letters = {self.extract_column_letter(label) for label in excel_labels}
+            column_stats = None
+            if len(column_letters) == 1:
+                column_stats = columns.setdefault(column_letters.pop(), {'total': 0, 'numeric': 0})
+            profile = self.choose_profile(coordinates, column_stats)
+            extracted_text, confidence, retries = self.recognize_cell(coordinates, profile)
+            self.cell_profiles[coordinates] = profile
+            self.cell_texts[coordinates] = extracted_text
+            self.cell_confidences[coordinates] = confidence
+            self.cell_retries[coordinates] = retries
+            # Решение о числовом столбце принимается по первым непустым ячейкам и дальше
+            # не меняется: текст, прочитанный с белым списком цифр, всегда выглядит числом
+            if column_stats is not None and extracted_text and \
+                    column_stats['total'] < self.NUMERIC_COLUMN_MIN_SAMPLES:
+                column_stats['total'] += 1
+                column_stats['numeric'] += bool(self.NUMERIC_PATTERN.match(extracted_text))
+            print(f"Text '{extracted_text}' is associated with cells: {', '.join(excel_labels)}")
+            yield {
+                'coordinates': coordinates,
+                'cells': excel_labels,
+                'text': extracted_text,
+                'confidence': confidence,
+                'profile': profile,
+                'retries': retries
+            }
+        print(f"Повторных распознаваний ячеек с низкой уверенностью: {self.retry_count}")
 
     @staticmethod
     def extract_row_number(cell):
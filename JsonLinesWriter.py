@@ -0,0 +1,46 @@
+import json
+import threading
+
+
+class JsonLinesWriter:
+    """
+    Запись результатов распознавания в формате JSON Lines: одна ячейка — одна строка.
+
+    Каждая строка сбрасывается на диск сразу после записи, поэтому файл можно
+    читать во время обработки, а при ошибке в нём остаются все готовые ячейки.
+    Запись из нескольких потоков допускается.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, result, **fields):
+        """
+        Записывает результат одной ячейки.
+        :param fields: дополнительные поля строки, например страница и номер таблицы.
+        """
+        record = dict(fields)
+        record.update({
+            'cells': list(result['cells']),
+            'text': result['text'],
+            'confidence': result['confidence'],
+            'profile': result['profile'],
+            'retries': result['retries'],
+            'coordinates': [int(value) for value in result['coordinates']]
+        })
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from CheckpointStore import CheckpointStore
+
+
+class LayoutRegistry:
+    """
+    Реестр разметок повторяющихся бланков.
+
+    Для каждой известной разметки хранятся отпечаток страницы, сетка Excel-ячеек
+    (cells_dict) и сопоставление ячеек таблицы с Excel-ячейками (associated_cells).
+    Отпечаток — позиции и относительная длина линий разметки, найденные по
+    проекциям маски линий уменьшенной страницы. Если отпечаток новой страницы
+    совпадает с сохранённым с точностью до сдвига и масштаба, геометрия разметки
+    переносится на страницу, и поиск сетки, структуры и сопоставление пропускаются.
+    Перед этим перенесённые ячейки проверяются по бинаризованной странице: какие
+    края ячеек покрыты линиями и есть ли линии внутри, должно совпадать с
+    зарегистрированной страницей, иначе (например, на странице объединены другие
+    ячейки) совпадение отбрасывается.
+    """
+
+    # Разметки хранятся в CheckpointStore как записи этого этапа
+    STAGE = 'layout'
+    # Длинная сторона уменьшенной страницы, по которой строится отпечаток
+    FINGERPRINT_SIZE = 1024
+    # Длина ядра выделения линий относительно соответствующей стороны страницы:
+    # ядро должно быть длиннее штрихов букв, иначе текст даёт ложные линии
+    LINE_KERNEL_FRACTION = 0.08
+    # Строка (столбец) считается частью линии, если линии покрывают не меньше этой доли стороны
+    MIN_LINE_COVERAGE = 0.05
+    # Меньше линий по любой из осей недостаточно для надёжного совмещения
+    MIN_LINES = 3
+    # Допустимые масштаб, расхождение масштабов по осям, отклонение линий
+    # после совмещения (доля стороны страницы) и различие относительной длины линий
+    MAX_SCALE = 1.25
+    MAX_SCALE_MISMATCH = 0.05
+    MAX_RESIDUAL_FRACTION = 0.005
+    MAX_COVERAGE_DIFFERENCE = 0.15
+    # Край ячейки (или строка/столбец внутри неё) считается линией при покрытии
+    # не меньше LINE_COVERAGE и её отсутствием при покрытии меньше NO_LINE_COVERAGE;
+    # промежуточное покрытие (текст рядом с краем) не сравнивается
+    LINE_COVERAGE = 0.95
+    NO_LINE_COVERAGE = 0.6
+
+    def __init__(self, directory='layouts', max_layouts=200, auto_register=True):
+        """
+        :param auto_register: регистрировать разметку страницы, для которой
+            не нашлось совпадения, после полного распознавания её структуры.
+        """
+        self.directory = directory
+        self.max_layouts = max_layouts
+        self.auto_register = auto_register
+        self._lock = threading.Lock()
+        # Разметки вытесняются только по числу, начиная с самых давно совпадавших
+        self.store = CheckpointStore(directory, max_entries=max_layouts, max_bytes=None, max_age_days=None)
+        self.layouts = {}
+        for entry in self.entries():
+            # Загрузка при старте не считается совпадением
+            layout = self.store.load(self.STAGE, entry['name'], touch=False)
+            if layout is not None:
+                self.layouts[entry['name']] = layout
+
+    @classmethod
+    def fingerprint(cls, image_input):
+        """
+        Отпечаток разметки страницы.
+        :return: словарь с размером страницы (size), позициями горизонтальных (rows)
+            и вертикальных (columns) линий в пикселях исходной страницы, их
+            относительной длиной (row_coverage, column_coverage), уменьшенной
+            бинаризованной страницей (binary, в реестре не хранится) и её масштабом (scale).
+        """
+        if isinstance(image_input, str):
+            image = cv2.imread(image_input, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise ValueError("Изображение не найдено или указан некорректный путь.")
+        elif isinstance(image_input, np.ndarray):
+            image = image_input
+        else:
+            raise TypeError("image_input должен быть либо путем к файлу, либо numpy-массивом.")
+        height, width = image.shape[:2]
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        scale = min(1.0, cls.FINGERPRINT_SIZE / max(height, width))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # После уменьшения тонкие линии становятся серыми, поэтому порог локальный
+        thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY_INV, 15, 10)
+        small_height, small_width = thresh.shape
+
+        horizontal_kernel = cv2.getStructuringElement(
+            cv2.MORPH_RECT, (max(10, int(small_width * cls.LINE_KERNEL_FRACTION)), 1))
+        vertical_kernel = cv2.getStructuringElement(
+            cv2.MORPH_RECT, (1, max(10, int(small_height * cls.LINE_KERNEL_FRACTION))))
+        horizontal = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, horizontal_kernel)
+        vertical = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, vertical_kernel)
+
+        rows, row_coverage = cls._projection_lines(
+            np.count_nonzero(horizontal, axis=1) / small_width, scale)
+        columns, column_coverage = cls._projection_lines(
+            np.count_nonzero(vertical, axis=0) / small_height, scale)
+        return {
+            'size': (width, height),
+            'rows': rows,
+            'columns': columns,
+            'row_coverage': row_coverage,
+            'column_coverage': column_coverage,
+            'binary': thresh,
+            'scale': scale
+        }
+
+    @classmethod
+    def _projection_lines(cls, projection, scale):
+        """
+        Находит линии в проекции маски: каждая серия соседних позиций с покрытием
+        не меньше MIN_LINE_COVERAGE даёт одну линию.
+        :return: (начала линий в пикселях исходной страницы,
+            покрытие линий относительно самой длинной)
+        """
+        is_line = np.concatenate(([False], projection >= cls.MIN_LINE_COVERAGE, [False]))
+        edges = np.flatnonzero(np.diff(is_line.astype(np.int8)))
+        starts, ends = edges[0::2], edges[1::2]
+        if len(starts) == 0:
+            return np.empty(0), np.empty(0)
+        coverage = np.array([projection[start:end].max() for start, end in zip(starts, ends)])
+        return starts / scale, coverage / coverage.max()
+
+    @classmethod
+    def _fit_axis(cls, stored, current):
+        """
+        Подбирает масштаб и сдвиг по одной оси методом наименьших квадратов.
+        :return: (масштаб, сдвиг, максимальное отклонение линий в пикселях)
+        """
+        scale, shift = np.polyfit(stored, current, 1)
+        residual = np.abs(scale * stored + shift - current).max()
+        return scale, shift, residual
+
+    def _tolerance(self, fingerprint):
+        """Допустимое отклонение линий после совмещения, пиксели исходной страницы"""
+        side = max(fingerprint['size'])
+        return max(2.0, self.MAX_RESIDUAL_FRACTION * side, side / self.FINGERPRINT_SIZE)
+
+    def _align(self, layout, fingerprint):
+        """
+        Совмещает сохранённую разметку со страницей.
+        :return: (sx, tx, sy, ty, отклонение) или None, если разметки не совпадают.
+        """
+        stored = layout['fingerprint']
+        for axis in ('rows', 'columns'):
+            if len(stored[axis]) != len(fingerprint[axis]) or len(fingerprint[axis]) < self.MIN_LINES:
+                return None
+        for axis in ('row_coverage', 'column_coverage'):
+            if np.abs(stored[axis] - fingerprint[axis]).max() > self.MAX_COVERAGE_DIFFERENCE:
+                return None
+
+        sy, ty, row_residual = self._fit_axis(stored['rows'], fingerprint['rows'])
+        sx, tx, column_residual = self._fit_axis(stored['columns'], fingerprint['columns'])
+        if not all(1 / self.MAX_SCALE <= s <= self.MAX_SCALE for s in (sx, sy)):
+            return None
+        if abs(sx / sy - 1) > self.MAX_SCALE_MISMATCH:
+            return None
+        residual = max(row_residual, column_residual)
+        if residual > self._tolerance(fingerprint):
+            return None
+        return sx, tx, sy, ty, residual
+
+    def _cell_signature(self, fingerprint, cells):
+        """
+        Подпись ячеек по бинаризованной странице: для каждой ячейки покрыты ли линией
+        её четыре края и есть ли внутри сквозная горизонтальная и вертикальная линия.
+        :return: массив (число ячеек, 6): 1 — линия, 0 — линии нет, -1 — неоднозначно
+            или ячейка слишком мала для проверки.
+        """
+        binary = fingerprint['binary']
+        scale = fingerprint['scale']
+        # Полоса поиска линии вокруг края, пиксели уменьшенной страницы
+        band = int(np.ceil(self._tolerance(fingerprint) * scale)) + 1
+        signature = np.full((len(cells), 6), -1, dtype=np.int8)
+        for index, cell in enumerate(cells):
+            x1, y1, x2, y2 = (int(round(value * scale)) for value in cell)
+            if x2 - x1 <= 2 * band + 2 or y2 - y1 <= 2 * band + 2:
+                continue
+            # Углы не учитываются: там сходятся линии соседних ячеек
+            inner_x = slice(x1 + band + 1, x2 - band)
+            inner_y = slice(y1 + band + 1, y2 - band)
+            interior = binary[inner_y, inner_x] > 0
+            coverage = (
+                binary[max(0, y1 - band):y1 + band + 1, inner_x].any(axis=0).mean(),
+                binary[max(0, y2 - band):y2 + band + 1, inner_x].any(axis=0).mean(),
+                binary[inner_y, max(0, x1 - band):x1 + band + 1].any(axis=1).mean(),
+                binary[inner_y, max(0, x2 - band):x2 + band + 1].any(axis=1).mean(),
+                interior.mean(axis=1).max(),
+                interior.mean(axis=0).max()
+            )
+            signature[index] = [
+                1 if value >= self.LINE_COVERAGE else 0 if value < self.NO_LINE_COVERAGE else -1
+                for value in coverage
+            ]
+        return signature
+
+    def match(self, fingerprint):
+        """
+        Ищет разметку, совпадающую с отпечатком страницы.
+        :return: словарь с именем разметки (name), перенесёнными на страницу
+            cells_dict и associated_cells и отклонением линий (residual) или None.
+        """
+        with self._lock:
+            layouts = list(self.layouts.items())
+        candidates = []
+        for name, layout in layouts:
+            alignment = self._align(layout, fingerprint)
+            if alignment is not None:
+                candidates.append((alignment[-1], name, layout, alignment))
+        width, height = fingerprint['size']
+
+        for _, name, layout, (sx, tx, sy, ty, residual) in sorted(candidates, key=lambda c: c[0]):
+            def transform(box):
+                x1, y1, x2, y2 = box
+                return (
+                    int(np.clip(round(sx * x1 + tx), 0, width)),
+                    int(np.clip(round(sy * y1 + ty), 0, height)),
+                    int(np.clip(round(sx * x2 + tx), 0, width)),
+                    int(np.clip(round(sy * y2 + ty), 0, height))
+                )
+
+            associated_cells = {
+                transform(cell): list(labels) for cell, labels in layout['associated_cells'].items()
+            }
+            stored = layout.get('signature')
+            if stored is None:
+                # Разметка сохранена до появления проверки линий ячеек — подтвердить её нечем
+                continue
+            signature = self._cell_signature(fingerprint, list(associated_cells))
+            checked = (signature >= 0) & (stored >= 0)
+            if signature.shape != stored.shape or (signature[checked] != stored[checked]).any():
+                print(f"Разметка '{name}' совмещена, но линии ячеек на странице другие")
+                continue
+            self.store.touch(self.STAGE, name)
+            return {
+                'name': name,
+                'cells_dict': {label: transform(box) for label, box in layout['cells_dict'].items()},
+                'associated_cells': associated_cells,
+                'residual': residual
+            }
+        return None
+
+    def register(self, fingerprint, cells_dict, associated_cells):
+        """
+        Сохраняет разметку страницы.
+        :return: имя разметки или None, если для совмещения на странице слишком мало линий.
+        """
+        if len(fingerprint['rows']) < self.MIN_LINES or len(fingerprint['columns']) < self.MIN_LINES:
+            return None
+        if not associated_cells:
+            return None
+        # Объединения ячеек входят в имя: бланки с одной сеткой, но разными
+        # объединёнными ячейками хранятся отдельно, и match() выбирает между ними
+        payload = json.dumps([fingerprint['size'], np.round(fingerprint['rows']).tolist(),
+                              np.round(fingerprint['columns']).tolist(), sorted(cells_dict),
+                              sorted(sorted(labels) for labels in associated_cells.values())])
+        name = hashlib.sha256(payload.encode()).hexdigest()[:16]
+        layout = {
+            'fingerprint': {key: value for key, value in fingerprint.items() if key != 'binary'},
+            'cells_dict': dict(cells_dict),
+            'associated_cells': dict(associated_cells),
+            'signature': self._cell_signature(fingerprint, list(associated_cells))
+        }
+        self.store.save(self.STAGE, name, layout)
+        with self._lock:
+            self.layouts[name] = layout
+        print(f"Зарегистрирована разметка '{name}'")
+        self._forget_removed()
+        return name
+
+    def entries(self):
+        """
+        Список сохранённых разметок, начиная с самых давно совпадавших.
+        """
+        return [dict(entry, name=entry['key']) for entry in self.store.entries()
+                if entry['stage'] == self.STAGE]
+
+    def evict(self):
+        """
+        Удаляет самые давно совпадавшие разметки сверх max_layouts.
+        :return: количество удалённых разметок.
+        """
+        removed = self.store.evict()
+        self._forget_removed()
+        return removed
+
+    def clear(self):
+        removed = self.store.clear()
+        with self._lock:
+            self.layouts = {}
+        return removed
+
+    def _forget_removed(self):
+        """Убирает из памяти разметки, которых уже нет на диске"""
+        names = {entry['name'] for entry in self.entries()}
+        with self._lock:
+            self.layouts = {name: layout for name, layout in self.layouts.items() if name in names}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Управление реестром разметок бланков.")
+    parser.add_argument('command', choices=['list', 'match', 'clear'])
+    parser.add_argument('image', nargs='?', help="изображение для команды match")
+    parser.add_argument('--dir', default='layouts')
+    args = parser.parse_args()
+
+    registry = LayoutRegistry(args.dir)
+    if args.command == 'list':
+        for entry in registry.entries():
+            layout = registry.layouts.get(entry['name'])
+            if layout is None:
+                continue
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))
+            print(f"{entry['name']}  {len(layout['fingerprint']['rows']):>3} x "
+                  f"{len(layout['fingerprint']['columns']):<3} линий  "
+                  f"{len(layout['associated_cells']):>4} ячеек  {last_used}")
+        print(f"Всего разметок: {len(registry.layouts)}")
+    elif args.command == 'match':
+        if args.image is None:
+            parser.error("для команды match нужно указать изображение")
+        result = registry.match(LayoutRegistry.fingerprint(args.image))
+        if result is None:
+            print("Совпадающая разметка не найдена")
+        else:
+            print(f"Разметка '{result['name']}', отклонение линий {result['residual']:.1f} пикс.")
+    else:
+        print(f"Удалено разметок: {registry.clear()}")
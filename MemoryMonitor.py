@@ -0,0 +1,73 @@
+import resource
+import sys
+import threading
+
+
+class MemoryMonitor:
+    """
+    Замер пикового RSS процесса на участке кода.
+
+    На Linux фоновый поток периодически читает VmRSS из /proc/self/status,
+    поэтому пик считается только для участка внутри with. На других системах
+    используется ru_maxrss — пик за всё время жизни процесса.
+    """
+
+    STATUS_PATH = '/proc/self/status'
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def current_rss(cls):
+        """
+        Текущий RSS процесса в байтах или None, если он недоступен.
+        """
+        try:
+            with open(cls.STATUS_PATH) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    @staticmethod
+    def max_rss():
+        """Пиковый RSS за время жизни процесса в байтах"""
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    def _sample(self):
+        while True:
+            rss = self.current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak_rss = self.current_rss() or 0
+        if self.peak_rss:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        rss = self.current_rss()
+        if rss is None:
+            self.peak_rss = self.max_rss()
+        else:
+            self.peak_rss = max(self.peak_rss, rss)
+        return False
+
+    @property
+    def peak_rss_mb(self):
+        return self.peak_rss / (1024 * 1024)
@@ -0,0 +1,59 @@
+import os
+
+import cv2
+
+
+class PageStream:
+    """
+    Постраничное чтение входных изображений: многостраничных TIFF,
+    каталогов с изображениями и списков путей.
+    Страницы декодируются по одной, поэтому в памяти не держится весь документ.
+    """
+
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+    TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+    def __init__(self, source, flags=cv2.IMREAD_COLOR):
+        if isinstance(source, str):
+            if os.path.isdir(source):
+                self.paths = sorted(
+                    os.path.join(source, name) for name in os.listdir(source)
+                    if name.lower().endswith(self.IMAGE_EXTENSIONS)
+                )
+            else:
+                self.paths = [source]
+        elif isinstance(source, (list, tuple)):
+            self.paths = list(source)
+        else:
+            raise TypeError("source должен быть путем к файлу, каталогу или списком путей.")
+        for path in self.paths:
+            if not os.path.isfile(path):
+                raise ValueError(f"Не удалось найти изображение: {path}")
+        self.flags = flags
+
+    def _page_count(self, path):
+        if path.lower().endswith(self.TIFF_EXTENSIONS):
+            return cv2.imcount(path, self.flags)
+        return 1
+
+    def __len__(self):
+        return sum(self._page_count(path) for path in self.paths)
+
+    def __iter__(self):
+        """
+        Возвращает пары (название страницы, изображение).
+        """
+        for path in self.paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            count = self._page_count(path)
+            for index in range(count):
+                if count > 1:
+                    ok, pages = cv2.imreadmulti(path, start=index, count=1, flags=self.flags)
+                    image = pages[0] if ok and pages else None
+                    page_name = f"{name} стр. {index + 1}"
+                else:
+                    image = cv2.imread(path, self.flags)
+                    page_name = name
+                if image is None:
+                    raise ValueError(f"Не удалось декодировать страницу {index + 1} файла {path}")
+                yield page_name, image
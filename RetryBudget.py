@@ -0,0 +1,27 @@
+import threading
+
+
+class RetryBudget:
+    """
+    Бюджет повторных распознаваний ячеек страницы.
+
+    Один объект передаётся всем ImageTextExtractor таблиц одной страницы
+    (в том числе распознаваемых параллельно), поэтому ограничение действует
+    на страницу целиком, а не на каждую таблицу.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Занимает одно повторное распознавание.
+        :return: False, если бюджет исчерпан.
+        """
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
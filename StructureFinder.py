@@ -1,6 +1,5 @@
 import warnings
 
-import matplotlib.colors as mcolors
 import torch
 from PIL import Image, ImageDraw, ImageFont
 from transformers import TableTransformerForObjectDetection, DetrImageProcessor
@@ -58,7 +57,7 @@ class StructureFinder:
         draw = ImageDraw.Draw(image)
 
         pil_colors = [
-            tuple(int(255 * ch) for ch in mcolors.to_rgb(color))
+            tuple(int(255 * ch) for ch in color)
             for color in self.COLORS
         ]
         try:
@@ -86,6 +85,7 @@ class StructureFinder:
 
             draw.text((box[0], box[1]), text, fill="black", font=font)
 
+        if output_path:
             image.save(output_path)
         return image
 
@@ -1,6 +1,4 @@
 import cv2
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 
 class TableAssociator:
@@ -25,15 +23,24 @@ class TableAssociator:
             print(f"Ячейка таблицы {table_cell} ассоциирована с Excel-ячейками: {', '.join(associated)}")
         return associated_cells
 
-    def associate_grid_and_cells(self, table_cells, cells_dict, image_path):
+    def associate_grid_and_cells(self, table_cells, cells_dict, image_path, visualize=False):
         associated_cells = {}
-        result = cv2.imread(image_path)
         for table_cell in table_cells:
             for cell_label, excel_cell in cells_dict.items():
                 if self.is_within(excel_cell, table_cell):
                     if table_cell not in associated_cells:
                         associated_cells[table_cell] = []
                     associated_cells[table_cell].append(cell_label)
+        if visualize:
+            self._visualize(table_cells, cells_dict, image_path)
+        return associated_cells
+
+    @staticmethod
+    def _visualize(table_cells, cells_dict, image_path):
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+
+        result = cv2.imread(image_path) if isinstance(image_path, str) else image_path
         plt.figure(figsize=(12, 10))
         # plt.imshow(cv2.cvtColor(result, cv2.COLOR_BGR2RGB))
         i = 0
@@ -55,4 +62,3 @@ class TableAssociator:
         # plt.axis('on')
         # plt.title('Ассоциация Excel-ячейки и найденной ячейки таблицы')
         # plt.show()
-        return associated_cells
@@ -1,18 +1,38 @@
 import cv2
-import matplotlib.pyplot as plt
+import numpy as np
 
 
 class TableDetector:
-    def __init__(self, image_path):
-        self.image_path = image_path
-        self.image = cv2.imread(image_path)
-        if self.image is None:
-            raise ValueError("Изображение не найдено или указан некорректный путь.")
-        self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        self.blur = cv2.GaussianBlur(self.gray, (3, 3), 0)
+    def __init__(self, image_input, visualize=False, low_memory=False):
+        """
+        :param low_memory: декодировать сразу в оттенки серого и не хранить
+            цветное изображение; визуализация тогда строится по бинаризованному.
+        """
+        self.visualize = visualize
+        read_flags = cv2.IMREAD_GRAYSCALE if low_memory else cv2.IMREAD_COLOR
+        if isinstance(image_input, str):
+            self.image_path = image_input
+            image = cv2.imread(image_input, read_flags)
+            if image is None:
+                raise ValueError("Изображение не найдено или указан некорректный путь.")
+        elif isinstance(image_input, np.ndarray):
+            self.image_path = None
+            image = image_input
+        else:
+            raise TypeError("image_input должен быть либо путем к файлу, либо numpy-массивом.")
+        self.image = None if low_memory else image
+
+        # Промежуточные изображения освобождаются сразу после бинаризации
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        del image
+        blur = cv2.GaussianBlur(gray, (3, 3), 0)
+        del gray
         self.thresh = cv2.threshold(
-            self.blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+            blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
         )[1]
+        del blur
+        self._horizontal_mask = None
+        self._vertical_mask = None
 
     @staticmethod
     def excel_cell_name(row, col):
@@ -22,11 +42,30 @@ class TableDetector:
             col_name = chr(65 + remainder) + col_name
         return f"{col_name}{row}"
 
+    def horizontal_mask(self):
+        """Маска горизонтальных линий таблицы (вычисляется один раз)"""
+        if self._horizontal_mask is None:
+            horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (50, 1))
+            self._horizontal_mask = cv2.morphologyEx(
+                self.thresh, cv2.MORPH_OPEN, horizontal_kernel, iterations=1
+            )
+        return self._horizontal_mask
+
+    def vertical_mask(self):
+        """Маска вертикальных линий таблицы (вычисляется один раз)"""
+        if self._vertical_mask is None:
+            vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 30))
+            self._vertical_mask = cv2.morphologyEx(
+                self.thresh, cv2.MORPH_OPEN, vertical_kernel, iterations=1
+            )
+        return self._vertical_mask
+
+    def line_mask(self):
+        """Объединённая маска линий разметки таблицы"""
+        return cv2.bitwise_or(self.horizontal_mask(), self.vertical_mask())
+
     def detect_horizontal_lines(self):
-        horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (50, 1))
-        horizontal_mask = cv2.morphologyEx(
-            self.thresh, cv2.MORPH_OPEN, horizontal_kernel, iterations=1
-        )
+        horizontal_mask = self.horizontal_mask()
         contours, _ = cv2.findContours(
             horizontal_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
         )
@@ -35,10 +74,7 @@ class TableDetector:
         return sorted(horizontal_lines, key=lambda x: x[1])
 
     def detect_vertical_lines(self):
-        vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 30))
-        vertical_mask = cv2.morphologyEx(
-            self.thresh, cv2.MORPH_OPEN, vertical_kernel, iterations=1
-        )
+        vertical_mask = self.vertical_mask()
         contours, _ = cv2.findContours(
             vertical_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
         )
@@ -46,73 +82,110 @@ class TableDetector:
         vertical_lines = [(x, y, x + w, y + h) for x, y, w, h in vertical_lines if h > 10]
         return sorted(vertical_lines, key=lambda x: x[0])
 
+    @staticmethod
+    def _intersecting_horizontal(horizontal_lines, vertical_lines):
+        """
+        Оставляет горизонтальные линии, пересекающиеся хотя бы с одной вертикальной.
+        Пересечения рамок проверяются сразу для всех пар линий.
+        """
+        horizontal = np.asarray(horizontal_lines, dtype=np.int64).reshape(-1, 4)
+        vertical = np.asarray(vertical_lines, dtype=np.int64).reshape(-1, 4)
+        h = horizontal[:, None, :]
+        v = vertical[None, :, :]
+        overlap_x = (h[..., 2] >= v[..., 0]) & (h[..., 0] <= v[..., 2])
+        overlap_y = (h[..., 1] <= v[..., 3]) & (h[..., 3] >= v[..., 1])
+        return horizontal[(overlap_x & overlap_y).any(axis=1)]
+
+    @staticmethod
+    def _cluster_positions(positions, thickness, max_tolerance):
+        """
+        Объединяет близкие позиции линий (толстая или разорванная линия даёт
+        несколько контуров в паре пикселей друг от друга). Допуск выводится из
+        медианной толщины линий и не превышает max_tolerance.
+        :return: отсортированные позиции линий, по одной (минимальной) на кластер.
+        """
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+        order = np.argsort(positions, kind='stable')
+        positions = np.asarray(positions)[order]
+        tolerance = min(max_tolerance, max(2, int(np.ceil(1.5 * np.median(thickness)))))
+        # Новый кластер начинается там, где разрыв между соседними позициями больше допуска
+        starts = np.concatenate(([True], np.diff(positions) > tolerance))
+        return positions[starts]
+
     def detect_grid(self):
         horizontal_lines = self.detect_horizontal_lines()
         vertical_lines = self.detect_vertical_lines()
+        min_width_cell = 10
+        min_height_cell = 10
 
         # Фильтруем горизонтальные линии: оставляем те, что пересекаются с вертикальными
-        filtered_horizontal = []
-        for h_line in horizontal_lines:
-            x1, y1, x2, y2 = h_line
-            for v_line in vertical_lines:
-                vx1, vy1, vx2, vy2 = v_line
-                if not (x2 < vx1 or x1 > vx2) and not (y1 > vy2 or y2 < vy1):
-                    filtered_horizontal.append(h_line)
-                    break
-
-        full_width = self.image.shape[1]
-        stretched_horizontal = [(0, y1, full_width, y1) for (_, y1, _, y2) in filtered_horizontal]
-        full_height = self.image.shape[0]
-        stretched_vertical = [(x1, 0, x1, full_height) for (x1, _, x2, _) in vertical_lines]
-
-        stretched_horizontal = sorted(stretched_horizontal, key=lambda x: x[1])
-        stretched_vertical = sorted(stretched_vertical, key=lambda x: x[0])
+        filtered_horizontal = self._intersecting_horizontal(horizontal_lines, vertical_lines)
+        vertical = np.asarray(vertical_lines, dtype=np.int64).reshape(-1, 4)
+
+        # Близкие линии сводим в одну, чтобы не порождать ложные узкие строки и столбцы
+        row_positions = self._cluster_positions(
+            filtered_horizontal[:, 1], filtered_horizontal[:, 3] - filtered_horizontal[:, 1], min_height_cell - 1
+        )
+        column_positions = self._cluster_positions(
+            vertical[:, 0], vertical[:, 2] - vertical[:, 0], min_width_cell - 1
+        )
+
+        full_width = self.thresh.shape[1]
+        full_height = self.thresh.shape[0]
+        stretched_horizontal = [(0, y, full_width, y) for y in row_positions.tolist()]
+        stretched_vertical = [(x, 0, x, full_height) for x in column_positions.tolist()]
 
         print("Горизонтальные линии:", stretched_horizontal)
         print("Вертикальные линии:", stretched_vertical)
 
-        min_width_cell = 10
-        min_height_cell = 10
-        rows_dict = {}
-
-        for i in range(len(stretched_horizontal) - 1):
-            row_start_y = stretched_horizontal[i][1]
-            row_end_y = stretched_horizontal[i + 1][1]
-            for j in range(len(stretched_vertical) - 1):
-                cell_start_x = stretched_vertical[j][0]
-                cell_end_x = stretched_vertical[j + 1][0]
-                if (cell_end_x - cell_start_x >= min_width_cell) and (row_end_y - row_start_y >= min_height_cell):
-                    cell = (cell_start_x, row_start_y, cell_end_x, row_end_y)
-                    row_index = (row_start_y + row_end_y) // 2
-                    if row_index not in rows_dict:
-                        rows_dict[row_index] = []
-                    rows_dict[row_index].append(cell)
-
-        sorted_rows = sorted(rows_dict.items(), key=lambda x: x[0])
-        sorted_cells_per_row = [cells for _, cells in sorted_rows]
+        # Строки и столбцы сетки между соседними линиями, не меньше минимального размера
+        row_bounds = np.stack([row_positions[:-1], row_positions[1:]], axis=1)
+        column_bounds = np.stack([column_positions[:-1], column_positions[1:]], axis=1)
+        row_bounds = row_bounds[row_bounds[:, 1] - row_bounds[:, 0] >= min_height_cell].tolist()
+        column_bounds = column_bounds[column_bounds[:, 1] - column_bounds[:, 0] >= min_width_cell].tolist()
+
+        sorted_cells_per_row = [
+            [(x1, y1, x2, y2) for x1, x2 in column_bounds]
+            for y1, y2 in row_bounds
+        ] if column_bounds else []
         print("Ячейки, распределённые по строкам:", sorted_cells_per_row)
 
+        cells_dict = {}
+        for row_idx, row in enumerate(sorted_cells_per_row):
+            for col_idx, cell in enumerate(row):
+                cell_label = self.excel_cell_name(row_idx + 1, col_idx + 1)
+                cells_dict[cell_label] = cell
+
         # Визуализация (по желанию)
+        if self.visualize:
+            self._visualize_grid(stretched_horizontal, stretched_vertical, cells_dict)
+        print("Словарь ячеек:", cells_dict)
+        return cells_dict
+
+    def _visualization_base(self):
+        if self.image is None:
+            return cv2.cvtColor(cv2.bitwise_not(self.thresh), cv2.COLOR_GRAY2BGR)
+        if self.image.ndim == 2:
+            return cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        return self.image.copy()
+
+    def _visualize_grid(self, stretched_horizontal, stretched_vertical, cells_dict):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(20, 20))
-        result = self.image.copy()
+        result = self._visualization_base()
         # plt.imshow(cv2.cvtColor(result, cv2.COLOR_BGR2RGB))
         for line in stretched_horizontal:
             plt.plot([line[0], line[2]], [line[1], line[1]], color='green', linewidth=2)
         for line in stretched_vertical:
             plt.plot([line[0], line[0]], [line[1], line[3]], color='red', linewidth=2)
-        cells_dict = {}
-        for row_idx, row in enumerate(sorted_cells_per_row):
-            for col_idx, cell in enumerate(row):
-                x1, y1, x2, y2 = cell
-                plt.plot([x1, x2], [y1, y2], color='blue', linewidth=1)
-                cell_label = self.excel_cell_name(row_idx + 1, col_idx + 1)
-                plt.text((x1 + x2) / 2, (y1 + y2) / 2, cell_label,
-                         color='black', ha='center', va='center', fontsize=8)
-                cells_dict[cell_label] = (x1, y1, x2, y2)
+        for cell_label, (x1, y1, x2, y2) in cells_dict.items():
+            plt.plot([x1, x2], [y1, y2], color='blue', linewidth=1)
+            plt.text((x1 + x2) / 2, (y1 + y2) / 2, cell_label,
+                     color='black', ha='center', va='center', fontsize=8)
         plt.axis('on')
         # plt.show()
-        print("Словарь ячеек:", cells_dict)
-        return cells_dict
 
     def _detect_nested_cells(self, thresh, cell):
         """
@@ -162,15 +235,17 @@ class TableDetector:
 
                 # Вывод ячейки для отладки (по желанию)
                 print(f'Ячейка: {cell}')
-                x1, y1, x2, y2 = cell
-                cell_image = self.image[y1:y2, x1:x2]
-                plt.figure(figsize=(5, 5))
-                # plt.imshow(cv2.cvtColor(cell_image, cv2.COLOR_BGR2RGB))
-                # plt.axis('off')
-                # plt.show()
 
         # 4. Визуализация итоговой сетки с диагоналями
-        output_image = self.image.copy()
+        if self.visualize:
+            self._visualize_structure(all_cells)
+
+        return all_cells
+
+    def _visualize_structure(self, all_cells):
+        import matplotlib.pyplot as plt
+
+        output_image = self._visualization_base()
         for (x1, y1, x2, y2) in all_cells:
             cv2.rectangle(output_image, (x1, y1), (x2, y2), (0, 255, 0), 2)  # Контур
             cv2.line(output_image, (x1, y1), (x2, y2), (255, 0, 0), 2)  # Диагональ
@@ -180,8 +255,6 @@ class TableDetector:
         # plt.axis('on')
         # plt.show()
 
-        return all_cells
-
     def _detect_horizontal_lines_structure(self, thresh):
         horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (50, 1))
         horizontal_mask = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, horizontal_kernel, iterations=1)
@@ -193,15 +266,8 @@ class TableDetector:
         contours_ver, _ = cv2.findContours(vertical_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         vertical_lines = [cv2.boundingRect(cnt) for cnt in contours_ver]
         vertical_lines = [(x, y, x + w, y + h) for x, y, w, h in vertical_lines if h > 10]
-        filtered_horizontal = []
-        for h_line in horizontal_lines:
-            x1, y1, x2, y2 = h_line
-            for v_line in vertical_lines:
-                vx1, vy1, vx2, vy2 = v_line
-                if not (x2 < vx1 or x1 > vx2) and not (y1 > vy2 or y2 < vy1):
-                    filtered_horizontal.append(h_line)
-                    break
-        filtered_horizontal = sorted(filtered_horizontal, key=lambda x: x[1])
+        filtered_horizontal = self._intersecting_horizontal(horizontal_lines, vertical_lines)
+        filtered_horizontal = filtered_horizontal[np.argsort(filtered_horizontal[:, 1], kind='stable')]
         rows = [
             (int(filtered_horizontal[i][1]), int(filtered_horizontal[i + 1][1]))
             for i in range(len(filtered_horizontal) - 1)
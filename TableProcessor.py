@@ -1,33 +1,300 @@
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
 from TableDetector import TableDetector
 from TableAssociator import TableAssociator
 from ImageTextExtractor import ImageTextExtractor
-from ExcelHelper import ExcelHelper
+from CheckpointStore import CheckpointStore
+from LayoutRegistry import LayoutRegistry
+from RetryBudget import RetryBudget
+from MemoryMonitor import MemoryMonitor
 
 
 class TableProcessor:
-    def __init__(self, image_path, excel_filename, lang='rus'):
+    # Параметры этапов входят в ключи контрольных точек; версию нужно
+    # увеличивать при изменении алгоритма этапа
+    GRID_PARAMS = {'version': 2}
+    STRUCTURE_PARAMS = {'version': 1}
+    ASSOCIATION_PARAMS = {'version': 1, 'tolerance': 5}
+    OCR_PARAMS = {'version': 5}
+    LAYOUT_PARAMS = {'version': 1}
+
+    def __init__(self, image_path, excel_filename=None, lang='rus', checkpoints=None, low_memory=False,
+                 min_confidence=60, retry_budget=20, preprocess=True, layouts=None, monitor_memory=None):
+        # Путь к изображению или уже декодированный numpy-массив
         self.image_path = image_path
         self.excel_filename = excel_filename
         self.lang = lang
+        self.checkpoints = checkpoints
+        # Режим экономии памяти: одно полутоновое изображение в отображаемом в память
+        # файле разделяется между детектированием и OCR
+        self.low_memory = low_memory
+        # Замер пикового RSS (по умолчанию в режиме экономии памяти); отключается,
+        # если замер уже ведёт вызывающий код, например DocumentProcessor по страницам
+        self.monitor_memory = low_memory if monitor_memory is None else monitor_memory
+        self.peak_rss = None
+        # Порог уверенности и бюджет повторного распознавания ячеек: число
+        # на эту таблицу или RetryBudget, общий для таблиц одной страницы
+        self.min_confidence = min_confidence
+        self.retry_budget = retry_budget
+        # Подготовка ячеек к OCR по бинаризованной странице и маске линий TableDetector
+        self.preprocess = preprocess
+        # Реестр разметок повторяющихся бланков (LayoutRegistry); при совпадении
+        # разметки поиск сетки, структуры и сопоставление пропускаются
+        self.layouts = layouts
+        # Имя совпавшей разметки последнего запуска
+        self.layout = None
+        # Длительность этапов последнего запуска, секунды
+        self.timings = {}
+        self.cells_dict = None
+        self.associated_cells = None
+        # Результаты распознавания по ячейкам в порядке поступления
+        # (см. ImageTextExtractor.iter_cell_results)
+        self.cell_results = None
+        self.retry_count = None
+        self._association_key = None
+        self._detector = None
+        self._image = None
+
+    def _get_image(self):
+        """
+        Источник изображения для этапов. В обычном режиме этапы сами декодируют файл,
+        в режиме экономии памяти файл или массив один раз переводится в оттенки серого
+        и переносится в отображаемый в память файл.
+        """
+        if not self.low_memory:
+            return self.image_path
+        if self._image is None:
+            if isinstance(self.image_path, str):
+                image = cv2.imread(self.image_path, cv2.IMREAD_GRAYSCALE)
+                if image is None:
+                    raise ValueError("Изображение не найдено или указан некорректный путь.")
+            elif self.image_path.ndim == 3:
+                image = cv2.cvtColor(self.image_path, cv2.COLOR_BGR2GRAY)
+            else:
+                image = self.image_path
+            self._image = self._memory_map(image)
+        return self._image
+
+    @staticmethod
+    def _memory_map(image):
+        """
+        Переносит изображение во временный файл, отображаемый в память: страницы
+        такого массива ядро может вытеснить без записи в swap.
+        """
+        with tempfile.TemporaryFile() as f:
+            mapped = np.memmap(f, dtype=image.dtype, mode='w+', shape=image.shape)
+        mapped[:] = image
+        mapped.flush()
+        return mapped
+
+    def _get_detector(self):
+        if self._detector is None:
+            self._detector = TableDetector(self._get_image(), low_memory=self.low_memory)
+        return self._detector
+
+    def _run_stage(self, stage, parents, params, compute):
+        """
+        Выполняет этап или загружает его результат из контрольной точки.
+        :return: (ключ этапа, результат этапа)
+        """
+        start = time.perf_counter()
+        try:
+            if self.checkpoints is None:
+                return None, compute()
+            key = CheckpointStore.stage_key(parents, stage, params)
+            result = self.checkpoints.load(stage, key)
+            if result is not None:
+                print(f"Этап '{stage}' загружен из контрольной точки")
+                return key, result
+            result = compute()
+            self.checkpoints.save(stage, key, result)
+            return key, result
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+
+    def _monitored(self, run):
+        """
+        Выполняет run(), при monitor_memory замеряя пиковый RSS. Отображаемое
+        в память изображение освобождается после выполнения.
+        """
+        if not self.monitor_memory:
+            try:
+                return run()
+            finally:
+                self._image = None
+        with MemoryMonitor() as monitor:
+            try:
+                result = run()
+            finally:
+                self._image = None
+        self.peak_rss = monitor.peak_rss
+        print(f"Пиковое RSS: {monitor.peak_rss_mb:.1f} МБ")
+        return result
 
-    def process(self):
-        detector = TableDetector(self.image_path)
-        cells_dict = detector.detect_grid()
-        all_cells = detector.detect_table_structure()
+    def _has_detection_checkpoints(self, image_key):
+        """
+        Проверяет, сохранены ли все этапы полного поиска таблицы для изображения.
+        Тогда они загружаются вместо сопоставления с разметкой, и распознанный
+        под их ключом текст тоже берётся из контрольной точки.
+        """
+        if self.checkpoints is None:
+            return False
+        grid_key = CheckpointStore.stage_key([image_key], 'grid', self.GRID_PARAMS)
+        structure_key = CheckpointStore.stage_key([image_key], 'structure', self.STRUCTURE_PARAMS)
+        association_key = CheckpointStore.stage_key([grid_key, structure_key], 'associations',
+                                                    self.ASSOCIATION_PARAMS)
+        return (self.checkpoints.contains('grid', grid_key)
+                and self.checkpoints.contains('structure', structure_key)
+                and self.checkpoints.contains('associations', association_key))
+
+    def detect(self):
+        """
+        Находит сетку и ячейки таблицы и сопоставляет их (всё, кроме OCR).
+        Для страницы известного бланка геометрия берётся из реестра разметок.
+        :return: (cells_dict, associated_cells)
+        """
+        self.timings = {}
+        self.layout = None
+        image_key = CheckpointStore.image_hash(self.image_path) if self.checkpoints is not None else None
+
+        fingerprint = None
+        if self.layouts is not None and not self._has_detection_checkpoints(image_key):
+            start = time.perf_counter()
+            fingerprint = LayoutRegistry.fingerprint(self._get_image())
+            match = self.layouts.match(fingerprint)
+            self.timings['layout'] = time.perf_counter() - start
+            if match is not None:
+                print(f"Разметка '{match['name']}' совпала, отклонение линий {match['residual']:.1f} пикс.")
+                self.layout = match['name']
+                self.cells_dict = match['cells_dict']
+                self.associated_cells = match['associated_cells']
+                if self.checkpoints is not None:
+                    self._association_key = CheckpointStore.stage_key(
+                        [image_key], 'layout', dict(self.LAYOUT_PARAMS, layout=match['name'])
+                    )
+                return self.cells_dict, self.associated_cells
+
+        grid_key, cells_dict = self._run_stage(
+            'grid', [image_key], self.GRID_PARAMS,
+            lambda: self._get_detector().detect_grid()
+        )
+        structure_key, all_cells = self._run_stage(
+            'structure', [image_key], self.STRUCTURE_PARAMS,
+            lambda: self._get_detector().detect_table_structure()
+        )
 
         associator = TableAssociator()
-        associated_cells = associator.associate_grid_and_cells(all_cells, cells_dict, self.image_path)
+        self._association_key, self.associated_cells = self._run_stage(
+            'associations', [grid_key, structure_key], self.ASSOCIATION_PARAMS,
+            lambda: associator.associate_grid_and_cells(all_cells, cells_dict, self.image_path)
+        )
+        self.cells_dict = cells_dict
+        if fingerprint is not None and self.layouts.auto_register:
+            self.layouts.register(fingerprint, cells_dict, self.associated_cells)
+        return self.cells_dict, self.associated_cells
+
+    def iter_results(self):
+        """
+        Распознаёт ячейки и отдаёт результат каждой по мере готовности;
+        если detect() ещё не вызывался, сначала выполняет его.
+        Время в timings['ocr'] не включает обработку результатов потребителем.
+        :return: генератор результатов ImageTextExtractor.iter_cell_results.
+        """
+        if self.associated_cells is None:
+            self.detect()
+        budget_limit = self.retry_budget.limit if isinstance(self.retry_budget, RetryBudget) else self.retry_budget
+        ocr_params = dict(self.OCR_PARAMS, lang=self.lang, min_confidence=self.min_confidence,
+                          retry_budget=budget_limit, preprocess=self.preprocess)
+        key = None
+        if self.checkpoints is not None:
+            key = CheckpointStore.stage_key([self._association_key], 'ocr', ocr_params)
+            stored = self.checkpoints.load('ocr', key)
+            if stored is not None:
+                print("Этап 'ocr' загружен из контрольной точки")
+                self._detector = None
+                self.timings['ocr'] = 0.0
+                self.cell_results = stored['cell_results']
+                self.retry_count = stored['retry_count']
+                yield from self.cell_results
+                return
+
+        elapsed = 0.0
+        start = time.perf_counter()
+        binary, line_mask = None, None
+        if self.preprocess:
+            detector = self._get_detector()
+            binary, line_mask = detector.thresh, detector.line_mask()
+        text_extractor = ImageTextExtractor(self._get_image(), lang=self.lang,
+                                            min_confidence=self.min_confidence,
+                                            retry_budget=self.retry_budget,
+                                            binary=binary, line_mask=line_mask)
+        self._detector = None
+        self.cell_results = []
+        try:
+            for result in text_extractor.iter_cell_results(self.associated_cells):
+                self.cell_results.append(result)
+                elapsed += time.perf_counter() - start
+                yield result
+                start = time.perf_counter()
+        finally:
+            elapsed += time.perf_counter() - start
+            self.timings['ocr'] = elapsed
+            self.timings['ocr_preprocess'] = text_extractor.timings['preprocess']
+            self.timings['ocr_tesseract'] = text_extractor.timings['tesseract']
+            self.retry_count = text_extractor.retry_count
+
+        # Контрольная точка сохраняется только для полностью распознанной таблицы
+        if key is not None:
+            self.checkpoints.save('ocr', key, {'cell_results': self.cell_results,
+                                               'retry_count': self.retry_count})
+
+    def extract(self, on_result=None):
+        """
+        Распознаёт таблицу без записи в Excel.
+        :param on_result: вызывается с результатом каждой ячейки по мере распознавания.
+        :return: (cells_dict, cell_results)
+        """
+        def run():
+            self.detect()
+            for result in self.iter_results():
+                if on_result is not None:
+                    on_result(result)
+            return self.cells_dict, self.cell_results
 
-        ExcelHelper.create_empty_excel_file(cells_dict)
+        return self._monitored(run)
 
-        text_extractor = ImageTextExtractor(self.image_path, lang=self.lang)
-        text_to_cells = text_extractor.create_text_to_cells(associated_cells)
+    def process(self, on_result=None):
+        """
+        Распознаёт таблицу и записывает ячейки в Excel-файл по мере распознавания;
+        при ошибке в файле остаются уже распознанные ячейки.
+        :param on_result: вызывается с результатом каждой ячейки после его записи.
+        :return: список результатов распознавания по ячейкам.
+        """
+        from ExcelCellWriter import ExcelCellWriter
 
-        ExcelHelper.create_excel(self.excel_filename, text_to_cells)
+        def run():
+            cells_dict, _ = self.detect()
+            writing = 0.0
+            with ExcelCellWriter(self.excel_filename, cells_dict) as writer:
+                for result in self.iter_results():
+                    start = time.perf_counter()
+                    writer.write(result)
+                    writing += time.perf_counter() - start
+                    if on_result is not None:
+                        on_result(result)
+                # Сохранение книги происходит при выходе из with
+                start = time.perf_counter()
+            self.timings['excel'] = writing + time.perf_counter() - start
+            return self.cell_results
 
+        return self._monitored(run)
 
 if __name__ == '__main__':
     image_path = 'images/output.jpg'
     excel_filename = 'final.xlsx'
-    processor = TableProcessor(image_path, excel_filename, lang='rus')
+    processor = TableProcessor(image_path, excel_filename, lang='rus', checkpoints=CheckpointStore())
     processor.process()
@@ -0,0 +1,133 @@
+"""
+Точка входа без графического интерфейса: конвертация, HTTP-сервис и проверка
+времени холодного старта. Не импортирует PyQt5 и matplotlib; тяжёлые
+зависимости загружаются только этапами, которым они нужны.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Модули, которые не должны загружаться при старте рабочего процесса
+FORBIDDEN_STARTUP_MODULES = (
+    'PyQt5', 'matplotlib', 'torch', 'transformers', 'pytesseract', 'pandas', 'openpyxl'
+)
+# Модули, импортируемые рабочим процессом при старте
+STARTUP_MODULES = ('headless', 'TableProcessor', 'DocumentProcessor', 'ConversionServer')
+
+IMPORTTIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)')
+
+
+def measure_startup(modules=STARTUP_MODULES):
+    """
+    Импортирует модули в отдельном интерпретаторе с -X importtime.
+    :return: (общее время импорта в секундах, словарь модуль -> накопленное время в секундах)
+    """
+    code = '; '.join(f"import {module}" for module in modules)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                               capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    cumulative = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, module = match.groups()
+        cumulative[module] = int(cumulative_us) / 1e6
+        total_us += int(self_us)
+    return total_us / 1e6, cumulative
+
+
+def check_startup(max_seconds=None, top=10):
+    """
+    Проверяет, что при старте не загружаются тяжёлые модули и (при заданном
+    max_seconds) что импорт укладывается в бюджет времени.
+    :return: код возврата для командной строки.
+    """
+    total, cumulative = measure_startup()
+    print(f"Время импорта при старте: {total:.3f} с")
+    for module, seconds in sorted(cumulative.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {module:<40} {seconds:.3f} с")
+
+    loaded = sorted(
+        module for module in cumulative
+        if module.split('.')[0] in FORBIDDEN_STARTUP_MODULES
+    )
+    failed = False
+    if loaded:
+        print(f"При старте загружены тяжёлые модули: {', '.join(loaded)}")
+        failed = True
+    if max_seconds is not None and total > max_seconds:
+        print(f"Время импорта превышает бюджет {max_seconds:.3f} с")
+        failed = True
+    return 1 if failed else 0
+
+
+def convert(args):
+    from DocumentProcessor import DocumentProcessor
+    from CheckpointStore import CheckpointStore
+    from LayoutRegistry import LayoutRegistry
+
+    processor = DocumentProcessor(args.source, args.output, lang=args.lang, crop=not args.no_crop,
+                                  workers=args.workers, multi_table=args.multi_table,
+                                  low_memory=args.low_memory, jsonl_filename=args.jsonl,
+                                  checkpoints=CheckpointStore() if args.checkpoints else None,
+                                  layouts=LayoutRegistry() if args.layouts else None)
+    processor.process()
+    for page, error in processor.errors.items():
+        print(f"Страница '{page}' пропущена: {str(error)}")
+    return 1 if processor.errors else 0
+
+
+def serve(args):
+    import ConversionServer
+    from CheckpointStore import CheckpointStore
+    from LayoutRegistry import LayoutRegistry
+
+    ConversionServer.serve(args.host, args.port, workers=args.workers, queue_size=args.queue_size,
+                           lang=args.lang, structure=args.structure,
+                           checkpoints=CheckpointStore() if args.checkpoints else None,
+                           layouts=LayoutRegistry() if args.layouts else None)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Конвертер таблиц без графического интерфейса.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="конвертировать изображение или документ")
+    convert_parser.add_argument('source', help="изображение, многостраничный TIFF или каталог")
+    convert_parser.add_argument('output')
+    convert_parser.add_argument('--lang', default='rus')
+    convert_parser.add_argument('--workers', type=int, default=1)
+    convert_parser.add_argument('--no-crop', action='store_true')
+    convert_parser.add_argument('--multi-table', action='store_true')
+    convert_parser.add_argument('--low-memory', action='store_true')
+    convert_parser.add_argument('--checkpoints', action='store_true')
+    convert_parser.add_argument('--layouts', action='store_true', help="использовать реестр разметок бланков")
+    convert_parser.add_argument('--jsonl', default=None, help="дополнительно писать ячейки в файл JSON Lines")
+
+    serve_parser = subparsers.add_parser('serve', help="запустить локальный HTTP-сервис")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--workers', type=int, default=2)
+    serve_parser.add_argument('--queue-size', type=int, default=8)
+    serve_parser.add_argument('--lang', default='rus')
+    serve_parser.add_argument('--structure', action='store_true')
+    serve_parser.add_argument('--checkpoints', action='store_true')
+    serve_parser.add_argument('--layouts', action='store_true', help="использовать реестр разметок бланков")
+
+    startup_parser = subparsers.add_parser('startup-check', help="измерить время холодного старта")
+    startup_parser.add_argument('--max-seconds', type=float, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        sys.exit(convert(args))
+    elif args.command == 'serve':
+        sys.exit(serve(args))
+    else:
+        sys.exit(check_startup(args.max_seconds))
@@ -2,19 +2,19 @@ import sys
 import cv2
 import numpy as np
 import tempfile
-from StructureFinder import StructureFinder
+import threading
 from PyQt5.QtCore import QThread, pyqtSignal
 from datetime import datetime
-from TableProcessor import TableProcessor
+from CheckpointStore import CheckpointStore
 import os
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton,
     QLabel, QFileDialog, QMessageBox, QProgressBar, QStackedWidget,
-    QDialog, QHBoxLayout, QLineEdit, QFormLayout
+    QDialog, QHBoxLayout, QLineEdit, QFormLayout, QCheckBox
 )
-from PyQt5.QtGui import QPixmap, QFont, QImage
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPixmap, QFont, QImage, QImageReader, QImageIOHandler
+from PyQt5.QtCore import Qt, QTimer, QSize
 
 from Cropper import Cropper
 
@@ -33,15 +33,63 @@ QPushButton:hover {
 """
 
 
-def qpixmap_to_cv(qpixmap):
-    qimage = qpixmap.toImage().convertToFormat(QImage.Format_RGBA8888)
-    width = qimage.width()
-    height = qimage.height()
-    ptr = qimage.bits()
-    ptr.setsize(qimage.byteCount())
-    arr = np.array(ptr).reshape(height, width, 4)
-    cv_img = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGR)
-    return cv_img
+# Предпросмотр строится один раз под эту долю доступной области экрана;
+# полноразмерное изображение нужно только для обработки
+PREVIEW_SCREEN_FRACTION = 0.8
+
+
+def preview_size():
+    """Максимальный размер предпросмотра (вызывать из потока интерфейса)"""
+    size = QApplication.primaryScreen().availableGeometry().size()
+    return QSize(int(size.width() * PREVIEW_SCREEN_FRACTION), int(size.height() * PREVIEW_SCREEN_FRACTION))
+
+
+def cv_to_preview(image, max_size):
+    """
+    Уменьшает изображение OpenCV до размера предпросмотра (увеличения нет).
+    :return: QImage, не зависящий от памяти numpy-массива.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, max_size.width() / width, max_size.height() / height)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB if image.ndim == 2 else cv2.COLOR_BGR2RGB)
+    qimage = QImage(rgb.data, rgb.shape[1], rgb.shape[0], rgb.strides[0], QImage.Format_RGB888)
+    return qimage.copy()
+
+
+def load_preview(path, max_size):
+    """
+    Декодирует файл сразу в размере предпросмотра (QImageReader.setScaledSize),
+    не создавая полноразмерного изображения. Можно вызывать из рабочего потока.
+    :return: QImage (isNull() при ошибке чтения).
+    """
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid():
+        # Масштаб применяется до поворота по EXIF
+        if reader.transformation() & QImageIOHandler.TransformationRotate90:
+            max_size = max_size.transposed()
+        scale = min(1.0, max_size.width() / size.width(), max_size.height() / size.height())
+        if scale < 1.0:
+            reader.setScaledSize(QSize(max(1, int(size.width() * scale)), max(1, int(size.height() * scale))))
+    return reader.read()
+
+
+_structure_finder = None
+_structure_finder_lock = threading.Lock()
+
+
+def get_structure_finder():
+    """Модель распознавания структуры загружается один раз за сеанс"""
+    global _structure_finder
+    with _structure_finder_lock:
+        if _structure_finder is None:
+            from StructureFinder import StructureFinder
+            _structure_finder = StructureFinder()
+        return _structure_finder
 
 
 def pil2pixmap(im):
@@ -73,13 +121,14 @@ class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Настройки программы")
-        self.setFixedSize(300, 200)
+        self.setFixedSize(300, 230)
 
         layout = QVBoxLayout()
 
         self.padding_x_edit = QLineEdit()
         self.padding_y_edit = QLineEdit()
         self.scale_edit = QLineEdit()
+        self.structure_preview_check = QCheckBox()
 
         self.save_btn = QPushButton("Сохранить")
         self.save_btn.setStyleSheet(BUTTON_STYLE)
@@ -90,6 +139,7 @@ class SettingsDialog(QDialog):
         form_layout.addRow("Горизонтальный отступ (padding_x):", self.padding_x_edit)
         form_layout.addRow("Вертикальный отступ (padding_y):", self.padding_y_edit)
         form_layout.addRow("Масштаб изображения:", self.scale_edit)
+        form_layout.addRow("Предпросмотр структуры:", self.structure_preview_check)
 
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.save_btn)
@@ -107,24 +157,26 @@ class SettingsDialog(QDialog):
             return {
                 'padding_x': int(self.padding_x_edit.text()),
                 'padding_y': int(self.padding_y_edit.text()),
-                'scale_factor': float(self.scale_edit.text())
+                'scale_factor': float(self.scale_edit.text()),
+                'structure_preview': self.structure_preview_check.isChecked()
             }
         except:
             return None
 
 
 class CropConfirmationDialog(QDialog):
-    def __init__(self, pixmap):
+    def __init__(self, preview):
+        """
+        :param preview: QImage обрезанной таблицы, уже уменьшенный до размера предпросмотра.
+        """
         super().__init__()
         self.setWindowTitle("Подтверждение обрезки")
         self.selected = False
         self.resize(500, 500)
         layout = QVBoxLayout()
-        scaled_pixmap = pixmap.scaled(int(pixmap.width()), int(pixmap.height()),
-                                      Qt.KeepAspectRatio, Qt.SmoothTransformation)
 
         self.image_label = QLabel()
-        self.image_label.setPixmap(scaled_pixmap)
+        self.image_label.setPixmap(QPixmap.fromImage(preview))
         self.image_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.image_label)
         question_label = QLabel("Правильно ли обрезалось фото?")
@@ -152,29 +204,164 @@ class CropConfirmationDialog(QDialog):
         self.reject()
 
 
+class ImageLoadWorker(QThread):
+    """
+    Декодирование загруженного фото в фоновом потоке: полноразмерное изображение
+    для обработки и уменьшенный из него предпросмотр.
+    """
+    loaded = pyqtSignal(str, QImage, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, file_path, max_size, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.max_size = max_size
+
+    def run(self):
+        try:
+            # imdecode вместо imread: imread не открывает пути с кириллицей в Windows
+            image = cv2.imdecode(np.fromfile(self.file_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Не удалось загрузить изображение.")
+            self.loaded.emit(self.file_path, cv_to_preview(image, self.max_size), image)
+        except Exception as e:
+            self.failed.emit(self.file_path, str(e))
+
+
+class TableCropWorker(QThread):
+    """
+    Обрезка таблицы в фоновом потоке: поиск рамки (при первом вызове для фото),
+    запись полноразмерной обрезки во временный JPEG и уменьшенный предпросмотр.
+    """
+    cropped = pyqtSignal(str, QImage)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, cropper, output_path, padding_x, padding_y, max_size, parent=None):
+        super().__init__(parent)
+        self.cropper = cropper
+        self.output_path = output_path
+        self.padding_x = padding_x
+        self.padding_y = padding_y
+        self.max_size = max_size
+
+    def run(self):
+        try:
+            cropped_file_path = self.cropper.extract_and_save_table(
+                self.output_path, padding_x=self.padding_x, padding_y=self.padding_y
+            )
+            if not cropped_file_path:
+                raise ValueError("Не удалось извлечь таблицу.")
+            # Рамка таблицы уже найдена, повторная обрезка — срез массива без поиска
+            cropped = self.cropper.extract_table(self.padding_x, self.padding_y)
+            self.cropped.emit(self.output_path, cv_to_preview(cropped, self.max_size))
+        except Exception as e:
+            self.failed.emit(self.output_path, str(e))
+
+
+class PreviewLoadWorker(QThread):
+    """Декодирование файла сразу в размере предпросмотра в фоновом потоке"""
+    loaded = pyqtSignal(QImage)
+
+    def __init__(self, path, max_size):
+        super().__init__()
+        self.path = path
+        self.max_size = max_size
+
+    def run(self):
+        preview = load_preview(self.path, self.max_size)
+        if not preview.isNull():
+            self.loaded.emit(preview)
+
+
+class TableProcessingWorker(QThread):
+    """Распознавание таблицы и запись Excel-файла в фоновом потоке"""
+    succeeded = pyqtSignal()
+    failed = pyqtSignal(str)
+    # Доля распознанных ячеек таблицы, проценты
+    progress = pyqtSignal(int)
+
+    def __init__(self, image_path, excel_path):
+        super().__init__()
+        self.image_path = image_path
+        self.excel_path = excel_path
+
+    def run(self):
+        from TableProcessor import TableProcessor
+
+        table_processor = TableProcessor(self.image_path, self.excel_path, lang='rus',
+                                         checkpoints=CheckpointStore())
+        done = 0
+
+        def on_result(result):
+            nonlocal done
+            done += 1
+            total = len(table_processor.associated_cells) or 1
+            self.progress.emit(int(100 * done / total))
+
+        try:
+            table_processor.process(on_result)
+            self.succeeded.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class StructurePreviewWorker(QThread):
+    """
+    Необязательный предпросмотр структуры таблицы (Table Transformer).
+    Его результат не используется при распознавании, поэтому он выполняется
+    параллельно с основной обработкой.
+    """
+    preview_ready = pyqtSignal(QImage)
+
+    def __init__(self, image_path, max_size, output_path="images/processed_output.jpg"):
+        super().__init__()
+        self.image_path = image_path
+        self.max_size = max_size
+        self.output_path = output_path
+
+    def run(self):
+        try:
+            detector = get_structure_finder()
+            result = detector.detect(self.image_path, resize_factor=1, threshold=0.97)
+            if result:
+                detector.visualize_detections(result, self.output_path)
+                preview = load_preview(self.output_path, self.max_size)
+                if not preview.isNull():
+                    self.preview_ready.emit(preview)
+        except Exception as e:
+            print(f"Ошибка предпросмотра структуры: {str(e)}")
+
+
 class ProcessingWindow(QDialog):
-    def __init__(self, image_path, excel_path, finish_callback, scale_factor):
+    def __init__(self, image_path, excel_path, finish_callback, scale_factor, structure_preview=True,
+                 preview=None):
+        """
+        :param preview: QImage предпросмотра таблицы; если не задан, он декодируется
+            из image_path сразу в уменьшенном размере в фоновом потоке.
+        """
         super().__init__()
         self.setWindowTitle("Обработка таблицы")
         self.finish_callback = finish_callback
         self.image_path = image_path
         self.excel_path = excel_path
         self.scale_factor = scale_factor
+        self.structure_preview = structure_preview
+        self.table_worker = None
+        self.preview_worker = None
+        self.image_worker = None
         self.resize(800, 600)
 
         layout = QVBoxLayout()
 
+        self.preview_size = preview_size()
         self.image_label = QLabel()
-        pixmap = QPixmap(image_path)
-
-        scaled_pixmap = pixmap.scaled(
-            int(pixmap.width() * self.scale_factor),
-            int(pixmap.height() * self.scale_factor),
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
-
-        self.image_label.setPixmap(scaled_pixmap)
+        if preview is None:
+            self.image_label.setText("Загрузка изображения...")
+            self.image_worker = PreviewLoadWorker(image_path, self.preview_size)
+            self.image_worker.loaded.connect(self.update_image)
+            self.image_worker.start()
+        else:
+            self.update_image(preview)
         self.image_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.image_label)
 
@@ -191,6 +378,7 @@ class ProcessingWindow(QDialog):
         self.setLayout(layout)
 
         self.progress = 0
+        self.detection_progress = None
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_progress)
         self.timer.start(100)
@@ -205,23 +393,40 @@ class ProcessingWindow(QDialog):
             self.timer.stop()
 
     def process_image(self):
-        detector = StructureFinder()
-        result = detector.detect(self.image_path, resize_factor=1, threshold=0.97)
-
-        if result:
-            processed_image = detector.visualize_detections(result, "images/processed_output.jpg")
-            self.update_image("images/processed_output.jpg")
-
-            table_processor = TableProcessor(self.image_path, self.excel_path, lang='rus')
-            try:
-                table_processor.process()
-                QTimer.singleShot(4100, self.processing_finished)
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Ошибка обработки: {str(e)}")
-                self.close()
-
-    def update_image(self, image_path):
-        pixmap = QPixmap(image_path)
+        if self.structure_preview:
+            self.preview_worker = StructurePreviewWorker(self.image_path, self.preview_size)
+            self.preview_worker.preview_ready.connect(self.update_image)
+            self.preview_worker.start()
+
+        self.table_worker = TableProcessingWorker(self.image_path, self.excel_path)
+        self.table_worker.succeeded.connect(self.on_table_processed)
+        self.table_worker.failed.connect(self.on_table_failed)
+        self.table_worker.progress.connect(self.on_cells_recognized)
+        self.table_worker.start()
+
+    def on_cells_recognized(self, percent):
+        # Пока идёт поиск сетки, индикатор движется по таймеру; с первой
+        # распознанной ячейки оставшаяся часть шкалы заполняется по доле готовых ячеек
+        if self.detection_progress is None:
+            self.timer.stop()
+            self.progress = min(self.progress, 50)
+            self.detection_progress = self.progress
+        self.progress = self.detection_progress + (100 - self.detection_progress) * percent / 100
+        self.progress_bar.setValue(int(self.progress))
+
+    def on_table_processed(self):
+        self.timer.stop()
+        self.progress_bar.setValue(100)
+        self.processing_finished()
+
+    def on_table_failed(self, message):
+        self.timer.stop()
+        QMessageBox.critical(self, "Ошибка", f"Ошибка обработки: {message}")
+        self.close()
+
+    def update_image(self, preview):
+        # Масштабируется уже уменьшенный предпросмотр, а не полноразмерное изображение
+        pixmap = QPixmap.fromImage(preview)
         scaled_pixmap = pixmap.scaled(
             int(pixmap.width() * self.scale_factor),
             int(pixmap.height() * self.scale_factor),
@@ -239,6 +444,31 @@ class ProcessingWindow(QDialog):
         self.finish_callback()
         self.accept()
 
+    @staticmethod
+    def _detach(worker, signal, slot):
+        """
+        Отсоединяет поток предпросмотра от окна: после закрытия окна его результат
+        не нужен, поэтому поток не ждём (загрузка модели и инференс могут идти
+        долго), и он удаляется сам после завершения.
+        """
+        signal.disconnect(slot)
+        worker.setParent(QApplication.instance())
+        worker.finished.connect(worker.deleteLater)
+        if worker.isFinished():
+            worker.deleteLater()
+
+    def done(self, result):
+        if self.preview_worker is not None:
+            self._detach(self.preview_worker, self.preview_worker.preview_ready, self.update_image)
+            self.preview_worker = None
+        if self.image_worker is not None:
+            self._detach(self.image_worker, self.image_worker.loaded, self.update_image)
+            self.image_worker = None
+        # Распознавание пишет Excel-файл, поэтому его поток должен завершиться
+        if self.table_worker is not None:
+            self.table_worker.wait()
+        super().done(result)
+
 
 class MainWorkScreen(QWidget):
     def __init__(self, processing_callback):
@@ -248,9 +478,18 @@ class MainWorkScreen(QWidget):
         self.settings = {
             'padding_x': 0,
             'padding_y': 0,
-            'scale_factor': 0.9
+            'scale_factor': 0.9,
+            'structure_preview': True
         }
 
+        # Cropper текущего изображения: найденная рамка таблицы переиспользуется
+        # при изменении отступов
+        self.cropper = None
+        # Фото, которое сейчас декодируется
+        self.loading_path = None
+        # Временный файл обрезки, которая сейчас выполняется
+        self.crop_path = None
+
         self.layout = QVBoxLayout(self)
 
         # Кнопка настроек
@@ -274,11 +513,15 @@ class MainWorkScreen(QWidget):
         dialog.padding_x_edit.setText(str(self.settings['padding_x']))
         dialog.padding_y_edit.setText(str(self.settings['padding_y']))
         dialog.scale_edit.setText(str(self.settings['scale_factor']))
+        dialog.structure_preview_check.setChecked(self.settings['structure_preview'])
 
         if dialog.exec_():
             new_settings = dialog.get_settings()
             if new_settings:
+                padding_changed = any(self.settings[key] != new_settings[key] for key in ('padding_x', 'padding_y'))
                 self.settings.update(new_settings)
+                if padding_changed and self.cropper is not None:
+                    self.detect_table()
             else:
                 QMessageBox.warning(self, "Ошибка", "Некорректные значения настроек")
 
@@ -292,40 +535,78 @@ class MainWorkScreen(QWidget):
             self.display_image(fileName)
 
     def display_image(self, file_path):
-        pixmap = QPixmap(file_path)
-        if pixmap.isNull():
-            QMessageBox.warning(self, "Ошибка", "Не удалось загрузить изображение.")
+        # Декодирование идёт в фоновом потоке; результат устаревшей загрузки отбрасывается
+        self.loading_path = file_path
+        self.cropper = None
+        self.crop_path = None
+        self.image_label.setText("Загрузка изображения...")
+        worker = ImageLoadWorker(file_path, preview_size(), self)
+        worker.loaded.connect(self.on_image_loaded)
+        worker.failed.connect(self.on_image_failed)
+        worker.finished.connect(worker.deleteLater)
+        worker.start()
+
+    def on_image_loaded(self, file_path, preview, image):
+        if file_path != self.loading_path:
             return
-        self.image_label.setPixmap(pixmap.scaled(
+        self.loading_path = None
+        self.image_label.setPixmap(QPixmap.fromImage(preview).scaled(
             self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
         ))
-        self.detect_table(pixmap)
-
-    def detect_table(self, pixmap):
         try:
-            cv_image = qpixmap_to_cv(pixmap)
-            cropper = Cropper(cv_image)
+            self.cropper = Cropper(image)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        self.detect_table()
 
+    def on_image_failed(self, file_path, message):
+        if file_path != self.loading_path:
+            return
+        self.loading_path = None
+        self.image_label.setText("Перетащите фото сюда или нажмите кнопку")
+        QMessageBox.warning(self, "Ошибка", message)
+
+    def detect_table(self):
+        # Обрезка идёт в фоновом потоке; результат устаревшей обрезки отбрасывается
+        try:
             temp_file = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
             temp_path = temp_file.name
             temp_file.close()
-
-            cropped_file_path = cropper.extract_and_save_table(
-                temp_path,
-                padding_x=self.settings['padding_x'],
-                padding_y=self.settings['padding_y']
-            )
-
-            if cropped_file_path:
-                cropped_pixmap = QPixmap(cropped_file_path)
-                self.show_crop_confirmation(cropped_pixmap, cropped_file_path)
-            else:
-                QMessageBox.warning(self, "Ошибка", "Не удалось извлечь таблицу.")
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
+            return
+        self.crop_path = temp_path
+        worker = TableCropWorker(self.cropper, temp_path, self.settings['padding_x'],
+                                 self.settings['padding_y'], preview_size(), self)
+        worker.cropped.connect(self.on_table_cropped)
+        worker.failed.connect(self.on_crop_failed)
+        worker.finished.connect(worker.deleteLater)
+        worker.start()
+
+    def on_table_cropped(self, cropped_file_path, preview):
+        if cropped_file_path != self.crop_path:
+            self._remove_temp(cropped_file_path)
+            return
+        self.crop_path = None
+        self.show_crop_confirmation(preview, cropped_file_path)
+
+    def on_crop_failed(self, cropped_file_path, message):
+        self._remove_temp(cropped_file_path)
+        if cropped_file_path != self.crop_path:
+            return
+        self.crop_path = None
+        QMessageBox.warning(self, "Ошибка", message)
+
+    @staticmethod
+    def _remove_temp(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
-    def show_crop_confirmation(self, pixmap, image_path):
-        dialog = CropConfirmationDialog(pixmap)
+    def show_crop_confirmation(self, preview, image_path):
+        dialog = CropConfirmationDialog(preview)
         result = dialog.exec_()
 
         if dialog.selected:
@@ -338,15 +619,17 @@ class MainWorkScreen(QWidget):
             if save_path:
                 if not save_path.endswith('.xlsx'):
                     save_path += '.xlsx'
-                self.processing_callback(image_path, save_path)
+                self.processing_callback(image_path, save_path, preview)
             else:
                 QMessageBox.information(self, "Отмена", "Сохранение отменено")
                 return
 
+            self.cropper = None
             self.image_label.clear()
             self.image_label.setText("Перетащите фото сюда или нажмите кнопку")
         else:
-            QMessageBox.information(self, "Отмена", "Пожалуйста, загрузите другое фото.")
+            QMessageBox.information(self, "Отмена",
+                                    "Измените отступы в настройках или загрузите другое фото.")
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
@@ -373,9 +656,11 @@ class MainWindow(QMainWindow):
     def switch_to_main(self):
         self.stack.setCurrentWidget(self.main_work_screen)
 
-    def open_processing_window(self, image_path, excel_path):
-        scale = self.main_work_screen.settings['scale_factor']
-        processing_win = ProcessingWindow(image_path, excel_path, self.return_to_start, scale)
+    def open_processing_window(self, image_path, excel_path, preview=None):
+        settings = self.main_work_screen.settings
+        processing_win = ProcessingWindow(image_path, excel_path, self.return_to_start,
+                                          settings['scale_factor'], settings['structure_preview'],
+                                          preview)
         processing_win.exec_()
 
     def return_to_start(self):
@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from headless import FORBIDDEN_STARTUP_MODULES, STARTUP_MODULES, measure_startup
+
+
+def test_startup_does_not_load_heavy_modules():
+    total, cumulative = measure_startup()
+    loaded = sorted(module for module in cumulative if module.split('.')[0] in FORBIDDEN_STARTUP_MODULES)
+    assert loaded == [], f"При старте загружены тяжёлые модули: {', '.join(loaded)}"
+    # Все модули рабочего процесса действительно импортированы и измерены
+    assert set(STARTUP_MODULES) <= set(cumulative)
+    assert total > 0